@@ -0,0 +1,89 @@
+"""
+Представление объектов в JSON с разреженными наборами полей.
+
+Каждое поле описано функцией, которая достаёт значение из объекта,
+и связями, которые для этого нужно подгрузить в select_related.
+Запрос ?fields=id,text выбирает поля, а связи берутся только те,
+что нужны выбранным полям.
+"""
+from collections import namedtuple
+
+Field = namedtuple('Field', ('get', 'related'))
+
+POST_FIELDS = {
+    'id': Field(lambda post: post.pk, ()),
+    'text': Field(lambda post: post.text, ()),
+    'pub_date': Field(lambda post: post.pub_date, ()),
+    'author': Field(lambda post: post.author.username, ('author',)),
+    'group': Field(
+        lambda post: post.group.slug if post.group_id else None,
+        ('group',)
+    ),
+    'image': Field(lambda post: post.image.url if post.image else None, ()),
+    'comments_count': Field(lambda post: post.comments_count, ()),
+}
+
+COMMENT_FIELDS = {
+    'id': Field(lambda comment: comment.pk, ()),
+    'text': Field(lambda comment: comment.text, ()),
+    'pub_date': Field(lambda comment: comment.pub_date, ()),
+    'author': Field(
+        lambda comment: comment.author.username if comment.author_id
+        else None,
+        ('author',)
+    ),
+}
+
+GROUP_FIELDS = {
+    'slug': Field(lambda group: group.slug, ()),
+    'title': Field(lambda group: group.title, ()),
+    'description': Field(lambda group: group.description, ()),
+    'posts_count': Field(lambda group: group.posts_count, ()),
+}
+
+AUTHOR_FIELDS = {
+    'username': Field(lambda user: user.username, ()),
+    'full_name': Field(lambda user: user.get_full_name(), ()),
+    'posts_count': Field(lambda user: user.stats.posts_count, ('stats',)),
+    'followers_count': Field(
+        lambda user: user.stats.followers_count,
+        ('stats',)
+    ),
+    'following_count': Field(
+        lambda user: user.stats.following_count,
+        ('stats',)
+    ),
+}
+
+
+class FieldsError(ValueError):
+    """В ?fields= есть поля, которых нет у объекта."""
+
+
+def parse_fields(value, available):
+    """Имена полей из строки ?fields=; пустая строка — все поля."""
+    if not value:
+        return list(available)
+    names = list(dict.fromkeys(
+        name.strip() for name in value.split(',') if name.strip()
+    ))
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise FieldsError(
+            'Неизвестные поля: %s. Доступны: %s.'
+            % (', '.join(unknown), ', '.join(available))
+        )
+    return names
+
+
+def related(names, available):
+    """Связи для select_related, нужные выбранным полям."""
+    return sorted({
+        relation
+        for name in names
+        for relation in available[name].related
+    })
+
+
+def serialize(obj, names, available):
+    return {name: available[name].get(obj) for name in names}
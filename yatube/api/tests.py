@@ -0,0 +1,163 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Writer')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='api-group',
+            description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author,
+                group=cls.group,
+                text='Пост %s' % number
+            )
+            for number in range(15)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0],
+            author=cls.reader,
+            text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+
+    def get_json(self, name, params=None, **kwargs):
+        response = self.client.get(reverse(name, kwargs=kwargs), params)
+        return response.status_code, json.loads(
+            b''.join(response.streaming_content) if response.streaming
+            else response.content
+        )
+
+    def test_index_cursor_pages(self):
+        """Лента листается курсором, как HTML-версия."""
+        status, data = self.get_json('api:index')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['version'], 'v1')
+        self.assertEqual(len(data['results']), 10)
+        self.assertIsNone(data['previous'])
+        self.assertEqual(data['results'][0]['id'], self.posts[-1].pk)
+        _, second = self.get_json('api:index', {'after': data['next']})
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next'])
+
+    def test_sparse_fields(self):
+        """?fields= оставляет только выбранные поля."""
+        with self.assertNumQueries(1):
+            status, data = self.get_json(
+                'api:index', {'fields': 'id,text', 'limit': 3}
+            )
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            data['results'][0],
+            {'id': self.posts[-1].pk, 'text': self.posts[-1].text}
+        )
+        status, data = self.get_json('api:index', {'fields': 'id,secret'})
+        self.assertEqual(status, 400)
+        self.assertIn('secret', data['error'])
+
+    def test_related_objects_in_one_query(self):
+        """Автор и группа подтягиваются тем же запросом."""
+        with self.assertNumQueries(1):
+            _, data = self.get_json('api:index')
+        self.assertEqual(data['results'][0]['author'], 'Writer')
+        self.assertEqual(data['results'][0]['group'], 'api-group')
+        with self.assertNumQueries(2):
+            _, data = self.get_json(
+                'api:post_detail', post_id=self.posts[0].pk
+            )
+        self.assertEqual(data['post']['comments_count'], 1)
+        self.assertEqual(data['comments'][0]['author'], 'Reader')
+
+    def test_post_comments_are_paged(self):
+        post = self.posts[0]
+        for number in range(3):
+            Comment.objects.create(
+                post=post, author=self.reader, text='more-%s' % number
+            )
+        _, data = self.get_json(
+            'api:post_detail', {'limit': 2}, post_id=post.pk
+        )
+        self.assertEqual(len(data['comments']), 2)
+        _, rest = self.get_json(
+            'api:post_detail',
+            {'limit': 2, 'after': data['next']},
+            post_id=post.pk
+        )
+        self.assertEqual(
+            [comment['text'] for comment in rest['comments']],
+            ['more-1', 'more-2']
+        )
+        self.assertIsNone(rest['next'])
+
+    def test_group_and_profile(self):
+        _, data = self.get_json('api:group_posts', slug='api-group')
+        self.assertEqual(data['group']['posts_count'], 15)
+        _, data = self.get_json(
+            'api:profile',
+            {'author_fields': 'username,followers_count'},
+            username='Writer'
+        )
+        self.assertEqual(
+            data['author'], {'username': 'Writer', 'followers_count': 1}
+        )
+        status, _ = self.get_json('api:profile', username='Nobody')
+        self.assertEqual(status, 404)
+
+    def test_follow_requires_login(self):
+        status, _ = self.get_json('api:follow_index')
+        self.assertEqual(status, 401)
+        self.client.force_login(self.reader)
+        _, data = self.get_json('api:follow_index', {'limit': 20})
+        self.assertEqual(len(data['results']), 15)
+
+    @override_settings(API_CHUNK_SIZE=4)
+    def test_stream(self):
+        """?stream отдаёт весь список потоком, частями из базы."""
+        response = self.client.get(
+            reverse('api:index'), {'stream': '', 'fields': 'id'}
+        )
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(
+            [post['id'] for post in data['results']],
+            [post.pk for post in reversed(self.posts)]
+        )
+
+    @override_settings(API_CHUNK_SIZE=4)
+    def test_follow_stream_reads_timeline(self):
+        """?stream ленты подписок читается из ленты, как и страница."""
+        self.client.force_login(self.reader)
+        params = {'stream': '', 'fields': 'id,author'}
+        _, data = self.get_json('api:follow_index', params)
+        self.assertEqual(
+            [post['id'] for post in data['results']],
+            [post.pk for post in reversed(self.posts)]
+        )
+        TimelineEntry.objects.filter(user=self.reader).delete()
+        _, data = self.get_json('api:follow_index', params)
+        self.assertEqual(data['results'], [])
+        # Посты автора выше предела раскладки подмешиваются.
+        with override_settings(TIMELINE_FANOUT_LIMIT=0):
+            _, data = self.get_json('api:follow_index', params)
+        self.assertEqual(len(data['results']), 15)
+
+    def test_read_only(self):
+        response = self.client.post(reverse('api:index'))
+        self.assertEqual(response.status_code, 405)
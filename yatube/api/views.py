@@ -0,0 +1,192 @@
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+
+from posts.models import Group, Post, User
+from posts.paginators import (FEED_ORDERING, CursorPaginator,
+                              get_comments_page)
+from posts.timeline import get_feed_page, iter_feed
+
+from . import serializers
+from .serializers import (AUTHOR_FIELDS, COMMENT_FIELDS, GROUP_FIELDS,
+                          POST_FIELDS)
+
+VERSION = 'v1'
+
+
+def _error(message, status):
+    return JsonResponse(
+        {'version': VERSION, 'error': message},
+        status=status
+    )
+
+
+def endpoint(view):
+    """Только чтение; ошибки запроса отдаются в JSON, а не страницей."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except serializers.FieldsError as error:
+            return _error(str(error), 400)
+        except ObjectDoesNotExist:
+            return _error('Не найдено.', 404)
+    return wrapper
+
+
+def _fields(request, available, param='fields'):
+    return serializers.parse_fields(request.GET.get(param), available)
+
+
+def _select_related(queryset, names, available):
+    related = serializers.related(names, available)
+    # select_related() без аргументов подтянул бы все связи.
+    return queryset.select_related(*related) if related else queryset
+
+
+def _per_page(request, default=None):
+    default = default or settings.NUMBER_TEN
+    try:
+        per_page = int(request.GET.get('limit', default))
+    except ValueError:
+        return default
+    return min(max(per_page, 1), settings.API_MAX_PAGE_SIZE)
+
+
+def _page(page_obj, names, extra):
+    return JsonResponse({
+        'version': VERSION,
+        **extra,
+        'results': [
+            serializers.serialize(post, names, POST_FIELDS)
+            for post in page_obj
+        ],
+        'next': getattr(page_obj, 'next_cursor', '') or None,
+        'previous': getattr(page_obj, 'previous_cursor', '') or None,
+    })
+
+
+def _stream(posts, names, extra):
+    """
+    Весь список одним ответом: посты (итератор, который читает их
+    из базы частями по API_CHUNK_SIZE) сразу отдаются клиенту,
+    так что память не растёт с числом постов.
+    """
+    encoder = DjangoJSONEncoder()
+    head = encoder.encode({'version': VERSION, **extra})
+    yield head[:-1] + ', "results": ['
+    separator, chunk = '', []
+    for post in posts:
+        chunk.append(encoder.encode(
+            serializers.serialize(post, names, POST_FIELDS)
+        ))
+        if len(chunk) == settings.API_CHUNK_SIZE:
+            yield separator + ', '.join(chunk)
+            separator, chunk = ', ', []
+    if chunk:
+        yield separator + ', '.join(chunk)
+    yield ']}'
+
+
+def _stream_response(posts, names, extra):
+    return StreamingHttpResponse(
+        _stream(posts, names, extra),
+        content_type='application/json'
+    )
+
+
+def _post_list(request, posts, extra=None):
+    """
+    Посты страницей по курсорам ?after= / ?before= или, с ?stream,
+    все сразу потоковым ответом.
+    """
+    extra = extra or {}
+    names = _fields(request, POST_FIELDS)
+    posts = _select_related(posts, names, POST_FIELDS)
+    if 'stream' in request.GET:
+        return _stream_response(
+            posts.order_by(*FEED_ORDERING).iterator(
+                chunk_size=settings.API_CHUNK_SIZE
+            ),
+            names,
+            extra
+        )
+    paginator = CursorPaginator(posts, _per_page(request))
+    page_obj = paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return _page(page_obj, names, extra)
+
+
+@endpoint
+def index(request):
+    return _post_list(request, Post.objects.all())
+
+
+@endpoint
+def group_posts(request, slug):
+    group = Group.objects.get(slug=slug)
+    return _post_list(request, group.posts.all(), {
+        'group': serializers.serialize(
+            group, _fields(request, GROUP_FIELDS, 'group_fields'),
+            GROUP_FIELDS
+        ),
+    })
+
+
+@endpoint
+def profile(request, username):
+    names = _fields(request, AUTHOR_FIELDS, 'author_fields')
+    author = _select_related(
+        User.objects.all(), names, AUTHOR_FIELDS
+    ).get(username=username)
+    return _post_list(request, author.posts.all(), {
+        'author': serializers.serialize(author, names, AUTHOR_FIELDS),
+    })
+
+
+@endpoint
+def post_detail(request, post_id):
+    """Пост и первая пачка комментариев; следующая — по ?after=."""
+    names = _fields(request, POST_FIELDS)
+    comment_names = _fields(request, COMMENT_FIELDS, 'comment_fields')
+    post = _select_related(Post.objects.all(), names, POST_FIELDS).get(
+        pk=post_id
+    )
+    comments = get_comments_page(
+        request,
+        _select_related(post.comments.all(), comment_names, COMMENT_FIELDS),
+        _per_page(request, settings.COMMENTS_PER_PAGE)
+    )
+    return JsonResponse({
+        'version': VERSION,
+        'post': serializers.serialize(post, names, POST_FIELDS),
+        'comments': [
+            serializers.serialize(comment, comment_names, COMMENT_FIELDS)
+            for comment in comments
+        ],
+        'next': comments.next_cursor or None,
+    })
+
+
+@endpoint
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return _error('Нужно войти.', 401)
+    names = _fields(request, POST_FIELDS)
+    if 'stream' in request.GET:
+        # Как и страница, весь список читается из ленты подписок.
+        posts = iter_feed(
+            request.user,
+            serializers.related(names, POST_FIELDS),
+            settings.API_CHUNK_SIZE
+        )
+        return _stream_response(posts, names, {})
+    page_obj = get_feed_page(request, _per_page(request))
+    return _page(page_obj, names, {})
@@ -0,0 +1,144 @@
+"""
+SQLite для нагрузки: стандартный бэкенд Django с настройками,
+при которых читатели не ждут писателей, а писатели — друг друга
+дольше необходимого.
+
+ENGINE = 'core.backends.sqlite3'. В OPTIONS, кроме аргументов
+sqlite3.connect (например, timeout), понимаются:
+
+pragmas              PRAGMA на каждое соединение, поверх PRAGMAS;
+busy_retries         сколько раз повторить запрос вне транзакции,
+                     если база занята;
+checkpoint_interval  раз во сколько секунд процесс переносит WAL
+                     в основной файл (0 — только автоматически).
+"""
+import logging
+import random
+import threading
+import time
+
+from django.db.backends.sqlite3 import base
+
+logger = logging.getLogger(__name__)
+
+# WAL: читатели не блокируют писателя и наоборот. synchronous=NORMAL
+# в режиме WAL не теряет целостность, только последние транзакции
+# при отключении питания. mmap и кэш страниц — чтобы горячие страницы
+# не читались с диска заново.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.01
+BUSY_BACKOFF_MAX = 0.5
+CHECKPOINT_INTERVAL = 300
+
+_checkpoint_lock = threading.Lock()
+_checkpointed_at = {}
+
+
+def apply_pragmas(connection, pragmas):
+    for name, value in pragmas.items():
+        connection.execute('PRAGMA %s = %s' % (name, value))
+
+
+def is_busy(error):
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def backoff(attempt):
+    """Пауза перед повтором: растёт вдвое, но не больше BUSY_BACKOFF_MAX."""
+    delay = min(BUSY_BACKOFF * 2 ** attempt, BUSY_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1)
+
+
+def retry_busy(call, retries, connection):
+    """
+    Выполняет call(), повторяя его, пока база занята.
+    Внутри транзакции не повторяет: откатывать и повторять её целиком
+    должен тот, кто её открыл.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except base.Database.OperationalError as error:
+            if (attempt == retries or not is_busy(error)
+                    or connection.in_transaction):
+                raise
+            time.sleep(backoff(attempt))
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    busy_retries = BUSY_RETRIES
+
+    def execute(self, query, params=None):
+        parent = super().execute
+        return retry_busy(
+            lambda: parent(query, params),
+            self.busy_retries,
+            self.connection
+        )
+
+    def executemany(self, query, param_list):
+        parent = super().executemany
+        return retry_busy(
+            lambda: parent(query, param_list),
+            self.busy_retries,
+            self.connection
+        )
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = {**PRAGMAS, **options.get('pragmas', {})}
+        self.busy_retries = options.get('busy_retries', BUSY_RETRIES)
+        self.checkpoint_interval = options.get(
+            'checkpoint_interval', CHECKPOINT_INTERVAL
+        )
+        params = super().get_connection_params()
+        for name in ('pragmas', 'busy_retries', 'checkpoint_interval'):
+            params.pop(name, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        apply_pragmas(connection, self.pragmas)
+        return connection
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SQLiteCursorWrapper)
+        cursor.busy_retries = self.busy_retries
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        # Транзакция сразу берёт блокировку записи: отложенная упёрлась
+        # бы в занятую базу на первой записи, когда ждать уже нельзя,
+        # а IMMEDIATE ждёт её по busy timeout и повторяется.
+        self.cursor().execute('BEGIN IMMEDIATE')
+
+    def _checkpoint_due(self):
+        if not self.checkpoint_interval or self.is_in_memory_db():
+            return False
+        now = time.monotonic()
+        name = self.settings_dict['NAME']
+        with _checkpoint_lock:
+            if now - _checkpointed_at.get(name, 0) < self.checkpoint_interval:
+                return False
+            _checkpointed_at[name] = now
+        return True
+
+    def _close(self):
+        # Соединение закрывается после отправки ответа, так что перенос
+        # WAL не задерживает посетителя. PASSIVE никого не ждёт.
+        if self.connection is not None and self._checkpoint_due():
+            try:
+                self.connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            except base.Database.Error:
+                logger.exception('Не удалось перенести WAL в базу')
+        super()._close()
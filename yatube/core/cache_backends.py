@@ -0,0 +1,357 @@
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE TABLE IF NOT EXISTS stats ('
+    ' name TEXT PRIMARY KEY,'
+    ' value INTEGER NOT NULL'
+    ') WITHOUT ROWID',
+    # Число записей ведут триггеры, чтобы не считать его COUNT(*)
+    # на каждой записи. С recursive_triggers удаление при INSERT OR
+    # REPLACE тоже вызывает cache_deleted.
+    'CREATE TRIGGER IF NOT EXISTS cache_inserted AFTER INSERT ON cache '
+    "BEGIN UPDATE stats SET value = value + 1 WHERE name = 'entries'; END",
+    'CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache '
+    "BEGIN UPDATE stats SET value = value - 1 WHERE name = 'entries'; END",
+    # Файл, созданный до триггеров: счёт начинается с настоящего числа.
+    "INSERT OR IGNORE INTO stats (name, value) "
+    "SELECT 'entries', COUNT(*) FROM cache",
+)
+STAT_NAMES = ('hits', 'misses', 'evictions')
+
+
+class SQLiteCache(BaseCache):
+    """
+    Кэш в файле SQLite, общий для всех процессов на одной машине.
+
+    Файл открывается в режиме WAL, так что чтения не ждут записей.
+    Размер ограничен MAX_ENTRIES: при переполнении вытесняются записи,
+    к которым дольше всего не обращались (LRU). Целые числа хранятся
+    как есть, поэтому incr() выполняется одним атомарным UPDATE.
+    Счётчики попаданий, промахов и вытеснений копятся в процессе
+    и раз в STATS_FLUSH_INTERVAL секунд сбрасываются в общую таблицу.
+
+    LOCATION — путь к файлу или URI SQLite (file:...?mode=memory&...).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._location = location
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        # Время последнего обращения обновляется не чаще, чем раз в
+        # LRU_RESOLUTION секунд, чтобы чтение почти никогда не писало.
+        self._lru_resolution = float(options.get('LRU_RESOLUTION', 30))
+        self._stats_interval = float(options.get('STATS_FLUSH_INTERVAL', 10))
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._pending = dict.fromkeys(STAT_NAMES, 0)
+        self._flushed_at = time.time()
+
+    # Соединение и транзакции
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(
+                self._location,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+                uri=self._location.startswith('file:'),
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('PRAGMA recursive_triggers=ON')
+            for statement in SCHEMA:
+                db.execute(statement)
+            self._local.db = db
+        return db
+
+    def _write(self, callback):
+        """Выполняет callback(db) в транзакции с блокировкой на запись."""
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = callback(db)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return result
+
+    # Сериализация
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    # Статистика
+
+    def _record(self, name, count=1):
+        with self._stats_lock:
+            self._pending[name] += count
+
+    def _maybe_flush_stats(self):
+        # Вызывается только вне транзакции: сброс сам пишет в файл.
+        if time.time() - self._flushed_at >= self._stats_interval:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        with self._stats_lock:
+            pending = self._pending
+            self._pending = dict.fromkeys(STAT_NAMES, 0)
+            self._flushed_at = time.time()
+        rows = [(name, count) for name, count in pending.items() if count]
+        if not rows:
+            return
+        self._write(lambda db: db.executemany(
+            'INSERT INTO stats (name, value) VALUES (?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+            rows,
+        ))
+
+    def stats(self):
+        """Попадания, промахи, вытеснения и доля попаданий всех процессов."""
+        self._flush_stats()
+        totals = dict.fromkeys(STAT_NAMES, 0)
+        totals['entries'] = 0
+        totals.update(self._db.execute('SELECT name, value FROM stats'))
+        lookups = totals['hits'] + totals['misses']
+        totals['hit_rate'] = totals['hits'] / lookups if lookups else 0.0
+        return totals
+
+    # Вытеснение
+
+    def _cull(self, db, now):
+        count = db.execute(
+            "SELECT value FROM stats WHERE name = 'entries'"
+        ).fetchone()[0]
+        if count <= self._max_entries:
+            return
+        # Истёкшие записи и так не читаются: удаляются, только когда
+        # кэш переполнен.
+        count -= db.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,)
+        ).rowcount
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            evicted = db.execute('DELETE FROM cache').rowcount
+        else:
+            evicted = db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                ' SELECT key FROM cache ORDER BY accessed LIMIT ?'
+                ')',
+                (max(count // self._cull_frequency, 1),)
+            ).rowcount
+        self._record('evictions', evicted)
+
+    # API кэша
+
+    def _fetch(self, keys, now):
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._db.execute(
+            'SELECT key, value, accessed FROM cache '
+            'WHERE key IN (%s) AND (expires IS NULL OR expires > ?)'
+            % placeholders,
+            (*keys, now)
+        ).fetchall()
+        stale = [
+            (now, key) for key, _, accessed in rows
+            if now - accessed >= self._lru_resolution
+        ]
+        if stale:
+            self._write(lambda db: db.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', stale
+            ))
+        self._record('hits', len(rows))
+        self._record('misses', len(keys) - len(rows))
+        self._maybe_flush_stats()
+        return {key: self._load(value) for key, value, _ in rows}
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._fetch([key], time.time()).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        if not made:
+            return {}
+        found = self._fetch(list(made), time.time())
+        return {made[key]: value for key, value in found.items()}
+
+    def _store(self, db, rows, mode, now):
+        """rows — список (key, value, expires); mode — REPLACE или IGNORE."""
+        cursor = db.executemany(
+            'INSERT OR %s INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)' % mode,
+            [(key, self._dump(value), expires, now)
+             for key, value, expires in rows]
+        )
+        self._cull(db, now)
+        return cursor.rowcount
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, value, expires))
+        if rows:
+            now = time.time()
+            self._write(lambda db: self._store(db, rows, 'REPLACE', now))
+            self._maybe_flush_stats()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+
+        def add(db):
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now)
+            )
+            return self._store(db, [(key, value, expires)], 'IGNORE', now)
+
+        return self._write(add) > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        return self._write(lambda db: db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (expires, now, key, now)
+        ).rowcount) > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+
+        def incr(db):
+            updated = db.execute(
+                'UPDATE cache SET value = value + ?, accessed = ? '
+                'WHERE key = ? AND typeof(value) = \'integer\' '
+                'AND (expires IS NULL OR expires > ?)',
+                (delta, now, key, now)
+            ).rowcount
+            if updated:
+                return db.execute(
+                    'SELECT value FROM cache WHERE key = ?', (key,)
+                ).fetchone()[0]
+            exists = db.execute(
+                'SELECT 1 FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, now)
+            ).fetchone()
+            if exists:
+                raise TypeError("Value of key '%s' is not an integer" % key)
+            raise ValueError("Key '%s' not found" % key)
+
+        return self._write(incr)
+
+    def throttle(self, keys, interval, burst, version=None):
+        """
+        Берёт по маркеру из вёдер keys одной транзакцией.
+
+        Ведро вмещает burst маркеров и пополняется на один раз
+        в interval секунд (GCRA: в ключе хранится время, к которому
+        ведро снова будет полным). Маркеры берутся из всех вёдер или
+        ни из одного. Возвращает 0, если маркеры взяты, иначе сколько
+        секунд ждать.
+        """
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        now = time.time()
+
+        def take(db):
+            placeholders = ', '.join('?' * len(keys))
+            full_at = dict(db.execute(
+                'SELECT key, value FROM cache WHERE key IN (%s) '
+                'AND (expires IS NULL OR expires > ?)' % placeholders,
+                (*keys, now)
+            ))
+            rows = []
+            wait = 0
+            for key in keys:
+                stored = full_at.get(key)
+                if stored is not None:
+                    stored = self._load(stored)
+                full = max(stored or now, now) + interval
+                wait = max(wait, full - burst * interval - now)
+                # Когда ведро снова полное, запись не нужна.
+                rows.append((key, self._dump(full), full, now))
+            if wait > 0:
+                return wait
+            db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                rows
+            )
+            return 0
+
+        return self._write(take)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_key(key, version=version) for key in keys]
+        for key in made:
+            self.validate_key(key)
+        if made:
+            self._write(lambda db: db.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in made]
+            ))
+
+    def clear(self):
+        self._write(lambda db: db.execute('DELETE FROM cache'))
+
+    def close(self, **kwargs):
+        # Соединения живут всё время работы потока: открывать файл
+        # на каждый запрос дороже, чем держать его открытым.
+        pass
@@ -0,0 +1,187 @@
+"""
+Замеры одного запроса: время и число SQL-запросов, время отрисовки
+шаблонов, время обращений к кэшу и доля попаданий в него.
+
+Хуки в шаблоны и кэш ставятся один раз при старте (install) и почти
+ничего не стоят, пока в потоке не идёт замер: тогда они сводятся
+к одной проверке. Замер запускает ServerTimingMiddleware.
+"""
+import functools
+import threading
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+from django.utils.module_loading import import_string
+
+# Методы кэша, время которых учитывается. decr и get_or_set в Django
+# вызывают incr, get и add и отдельно не оборачиваются.
+CACHE_METHODS = (
+    'get', 'get_many', 'set', 'set_many', 'add', 'touch', 'incr',
+    'has_key', 'delete', 'delete_many',
+)
+
+_local = threading.local()
+_MISSING = object()
+
+
+class Timings:
+    """Накопленные за запрос замеры; время — в секундах."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.total = 0.0
+        self.db = 0.0
+        self.queries = 0
+        self.templates = 0.0
+        self.cache = 0.0
+        self.hits = 0
+        self.misses = 0
+        # Вложенные вызовы (include, get_many через get) не считаются
+        # второй раз.
+        self.rendering = False
+        self.caching = False
+
+    def finish(self):
+        self.total = perf_counter() - self.started
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def header(self):
+        """Значение заголовка Server-Timing."""
+        metrics = [
+            'total;dur=%.2f' % (self.total * 1000),
+            'db;dur=%.2f' % (self.db * 1000),
+            'db-count;desc=%s' % self.queries,
+            'tmpl;dur=%.2f' % (self.templates * 1000),
+            'cache;dur=%.2f' % (self.cache * 1000),
+        ]
+        if self.hit_ratio is not None:
+            metrics.append('cache-hit;desc=%.2f' % self.hit_ratio)
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 2),
+            'db_ms': round(self.db * 1000, 2),
+            'db_count': self.queries,
+            'tmpl_ms': round(self.templates * 1000, 2),
+            'cache_ms': round(self.cache * 1000, 2),
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+        }
+
+
+def current():
+    """Замер, идущий в этом потоке, или None."""
+    return getattr(_local, 'timings', None)
+
+
+def _execute(execute, sql, params, many, context):
+    timings = current()
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += perf_counter() - started
+        timings.queries += 1
+
+
+@contextmanager
+def measure():
+    """Замеряет всё, что выполняется в этом потоке внутри блока."""
+    timings = Timings()
+    _local.timings = timings
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_execute))
+            yield timings
+    finally:
+        _local.timings = None
+        timings.finish()
+
+
+# Хуки
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, context):
+        timings = current()
+        if timings is None or timings.rendering:
+            return render(self, context)
+        timings.rendering = True
+        started = perf_counter()
+        db, cache = timings.db, timings.cache
+        try:
+            return render(self, context)
+        finally:
+            timings.rendering = False
+            # Запросы и кэш, вызванные из шаблона, учтены отдельно.
+            timings.templates += (
+                perf_counter() - started
+                - (timings.db - db) - (timings.cache - cache)
+            )
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _count_lookups(name, method):
+    """Обёртка, которая заодно считает попадания get и get_many."""
+    if name == 'get':
+        def call(self, key, default=None, version=None):
+            value = method(self, key, _MISSING, version=version)
+            if value is _MISSING:
+                current().misses += 1
+                return default
+            current().hits += 1
+            return value
+        return call
+    if name == 'get_many':
+        def call(self, keys, version=None):
+            keys = list(keys)
+            found = method(self, keys, version=version)
+            current().hits += len(found)
+            current().misses += len(keys) - len(found)
+            return found
+        return call
+    return method
+
+
+def _timed_cache(name, method):
+    counted = _count_lookups(name, method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        timings = current()
+        if timings is None or timings.caching:
+            return method(self, *args, **kwargs)
+        timings.caching = True
+        started = perf_counter()
+        try:
+            return counted(self, *args, **kwargs)
+        finally:
+            timings.caching = False
+            timings.cache += perf_counter() - started
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _install_cache(backend):
+    for name in CACHE_METHODS:
+        method = getattr(backend, name)
+        if not getattr(method, 'instrumented', False):
+            setattr(backend, name, _timed_cache(name, method))
+
+
+def install():
+    """Ставит хуки в отрисовку шаблонов и в бэкенды кэша из настроек."""
+    if not getattr(Template.render, 'instrumented', False):
+        Template.render = _timed_render(Template.render)
+    for options in settings.CACHES.values():
+        _install_cache(import_string(options['BACKEND']))
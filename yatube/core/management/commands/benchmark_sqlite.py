@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+
+from django.core.management.base import BaseCommand
+
+from core.backends.sqlite3 import base
+
+SCHEMA = (
+    'CREATE TABLE post ('
+    ' id INTEGER PRIMARY KEY,'
+    ' text TEXT NOT NULL,'
+    ' pub_date REAL NOT NULL,'
+    ' comments_count INTEGER NOT NULL DEFAULT 0'
+    ')',
+    'CREATE INDEX post_pub_date ON post (pub_date)',
+    'CREATE TABLE comment ('
+    ' id INTEGER PRIMARY KEY,'
+    ' post_id INTEGER NOT NULL REFERENCES post (id),'
+    ' text TEXT NOT NULL,'
+    ' pub_date REAL NOT NULL'
+    ')',
+    'CREATE INDEX comment_post ON comment (post_id, pub_date)',
+)
+# Стандартные настройки Django против профиля core.backends.sqlite3.
+PROFILES = {
+    'stock': {'pragmas': {}, 'begin': 'BEGIN', 'retries': 0},
+    'tuned': {
+        'pragmas': base.PRAGMAS,
+        'begin': 'BEGIN IMMEDIATE',
+        'retries': base.BUSY_RETRIES,
+    },
+}
+
+
+def _read(db, rnd, posts):
+    """Страница ленты и комментарии к одному из постов."""
+    db.execute(
+        'SELECT id, text FROM post WHERE pub_date < ? '
+        'ORDER BY pub_date DESC LIMIT 10',
+        (rnd.uniform(0, posts),)
+    ).fetchall()
+    db.execute(
+        'SELECT text FROM comment WHERE post_id = ? '
+        'ORDER BY pub_date LIMIT 50',
+        (rnd.randrange(1, posts),)
+    ).fetchall()
+
+
+def _write(db, rnd, posts, profile):
+    """Комментарий, как его пишет add_comment: проверка поста и запись."""
+    base.retry_busy(
+        lambda: db.execute(profile['begin']), profile['retries'], db
+    )
+    try:
+        post_id = rnd.randrange(1, posts)
+        db.execute('SELECT id FROM post WHERE id = ?', (post_id,)).fetchone()
+        db.execute(
+            'INSERT INTO comment (post_id, text, pub_date) VALUES (?, ?, ?)',
+            (post_id, 'комментарий', time.time())
+        )
+        db.execute(
+            'UPDATE post SET comments_count = comments_count + 1 '
+            'WHERE id = ?', (post_id,)
+        )
+        db.execute('COMMIT')
+    except BaseException:
+        if db.in_transaction:
+            db.execute('ROLLBACK')
+        raise
+
+
+def _worker(path, name, options, seed, results):
+    profile = PROFILES[name]
+    rnd = random.Random(seed)
+    done = failed = 0
+    with closing(sqlite3.connect(
+            path, timeout=options['timeout'], isolation_level=None)) as db:
+        base.apply_pragmas(db, profile['pragmas'])
+        deadline = time.monotonic() + options['seconds']
+        while time.monotonic() < deadline:
+            try:
+                if rnd.random() < options['write_ratio']:
+                    _write(db, rnd, options['posts'], profile)
+                else:
+                    _read(db, rnd, options['posts'])
+                done += 1
+            except sqlite3.OperationalError as error:
+                if not base.is_busy(error):
+                    raise
+                failed += 1
+    results.put((done, failed))
+
+
+def _prepare(path, posts, pragmas):
+    with closing(sqlite3.connect(path, isolation_level=None)) as db:
+        base.apply_pragmas(db, pragmas)
+        for statement in SCHEMA:
+            db.execute(statement)
+        db.execute('BEGIN')
+        db.executemany(
+            'INSERT INTO post (id, text, pub_date) VALUES (?, ?, ?)',
+            ((pk, 'пост %s' % pk, pk) for pk in range(1, posts + 1))
+        )
+        db.execute('COMMIT')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite со стандартными '
+        'настройками и с профилем core.backends.sqlite3 под смешанной '
+        'нагрузкой из нескольких процессов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help='Доля операций записи.'
+        )
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument(
+            '--timeout', type=float, default=5,
+            help='Сколько секунд SQLite ждёт занятую базу.'
+        )
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('spawn')
+        options = {
+            name: options[name] for name in (
+                'seconds', 'write_ratio', 'posts', 'timeout', 'workers'
+            )
+        }
+        for name, profile in PROFILES.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                _prepare(path, options['posts'], profile['pragmas'])
+                results = context.Queue()
+                workers = [
+                    context.Process(
+                        target=_worker,
+                        args=(path, name, options, seed, results)
+                    )
+                    for seed in range(options['workers'])
+                ]
+                for worker in workers:
+                    worker.start()
+                totals = [results.get() for _ in workers]
+                for worker in workers:
+                    worker.join()
+            done = sum(total[0] for total in totals)
+            failed = sum(total[1] for total in totals)
+            self.stdout.write(
+                '%s: %.0f операций/с, ошибок «database is locked»: %s' % (
+                    name, done / options['seconds'], failed
+                )
+            )
@@ -0,0 +1,18 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Показывает статистику попаданий и вытеснений кэша.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('alias', nargs='?', default='default')
+
+    def handle(self, *args, **options):
+        cache = caches[options['alias']]
+        if not hasattr(cache, 'stats'):
+            raise CommandError('Этот бэкенд кэша не ведёт статистику.')
+        stats = cache.stats()
+        for name in ('entries', 'hits', 'misses', 'evictions'):
+            self.stdout.write('%s: %s' % (name, stats[name]))
+        self.stdout.write('hit_rate: %.1f%%' % (stats['hit_rate'] * 100))
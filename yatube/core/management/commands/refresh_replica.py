@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import replica
+from core.routers import REPLICA
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет реплику основной базы для чтения лент; '
+        'с --interval делает это постоянно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять каждые столько секунд, пока не прервут.'
+        )
+
+    def handle(self, *args, **options):
+        if REPLICA not in settings.DATABASES:
+            raise CommandError('В DATABASES нет базы %r.' % REPLICA)
+        while True:
+            started = time.monotonic()
+            replica.refresh()
+            elapsed = time.monotonic() - started
+            self.stdout.write('Реплика обновлена за %.2f с.' % elapsed)
+            if not options['interval']:
+                return
+            time.sleep(max(options['interval'] - elapsed, 0))
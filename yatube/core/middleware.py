@@ -0,0 +1,63 @@
+import json
+import logging
+import random
+
+from django.conf import settings
+
+from . import instrumentation, routers
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTimingMiddleware:
+    """
+    Отдаёт замеры запроса в заголовке Server-Timing и, если включено
+    SERVER_TIMING_LOG, пишет их строкой JSON в журнал.
+
+    Замеряется доля запросов SERVER_TIMING_SAMPLE_RATE, остальные
+    проходят без хуков. Стоит первым, чтобы учесть всё остальное.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+        with instrumentation.measure() as timings:
+            response = self.get_response(request)
+        response['Server-Timing'] = timings.header()
+        if settings.SERVER_TIMING_LOG:
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                **timings.as_dict(),
+            }, ensure_ascii=False))
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """
+    После запроса, который писал в базу, ставит куку: пока она жива,
+    вьюхи с read_from_replica читают из основной базы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.start_request()
+        response = self.get_response(request)
+        # GET, записавший что-то попутно, куку не ставит: иначе такие
+        # страницы не попадали бы в полностраничный кэш.
+        if request.method not in ('GET', 'HEAD') and routers.wrote():
+            response.set_cookie(
+                routers.REPLICA_STICKY_COOKIE,
+                '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
@@ -0,0 +1,101 @@
+"""
+Ограничение частоты запросов на запись: ведро маркеров в кэше.
+
+Пределы задаются в settings.RATELIMITS по имени вьюхи:
+'add_comment': '10/m' — десять запросов подряд, дальше по одному
+в шесть секунд. Ведро заводится и на пользователя, и на IP-адрес;
+маркер берётся из обоих вёдер одной атомарной операцией кэша
+throttle(). Исчерпав предел, посетитель получает 429 с Retry-After.
+
+За обратными прокси REMOTE_ADDR — адрес прокси, и все посетители
+попали бы в одно ведро. settings.RATELIMIT_TRUSTED_PROXIES — сколько
+своих прокси стоит перед приложением: адрес посетителя тогда берётся
+из X-Forwarded-For, причём столько адресов справа, сколько дописали
+свои прокси. Левее стоит то, что прислал сам посетитель, этому
+не верим.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+KEY_PREFIX = 'ratelimit:'
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60): столько запросов за столько секунд."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period]
+
+
+def _throttle(keys, interval, burst):
+    if hasattr(cache, 'throttle'):
+        return cache.throttle(keys, interval, burst)
+    # Кэш без атомарной операции: то же ведро через get_many/set_many,
+    # с гонкой между параллельными запросами.
+    now = time.time()
+    found = cache.get_many(keys)
+    full = {
+        key: max(found.get(key, now), now) + interval for key in keys
+    }
+    wait = max(value - burst * interval - now for value in full.values())
+    if wait > 0:
+        return wait
+    cache.set_many(full, math.ceil(burst * interval))
+    return 0
+
+
+def client_ip(request):
+    """Адрес посетителя с учётом settings.RATELIMIT_TRUSTED_PROXIES."""
+    proxies = settings.RATELIMIT_TRUSTED_PROXIES
+    forwarded = [
+        address.strip() for address in
+        request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+        if address.strip()
+    ]
+    if proxies and len(forwarded) >= proxies:
+        # Первый свой прокси дописал адрес, с которого к нему пришли.
+        return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_keys(request, name):
+    """Вёдра посетителя: по IP-адресу и, если он вошёл, по пользователю."""
+    keys = ['%s%s:ip:%s' % (KEY_PREFIX, name, client_ip(request))]
+    if request.user.is_authenticated:
+        keys.append('%s%s:user:%s' % (KEY_PREFIX, name, request.user.pk))
+    return keys
+
+
+def ratelimit(name, methods=('POST',)):
+    """
+    Ограничивает вьюху пределом settings.RATELIMITS[name].
+    Запросы с методами не из methods проходят без ограничения.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rate = settings.RATELIMITS.get(name)
+            if (not settings.RATELIMIT_ENABLED or rate is None
+                    or request.method not in methods):
+                return view(request, *args, **kwargs)
+            count, period = parse_rate(rate)
+            wait = _throttle(
+                client_keys(request, name), period / count, count
+            )
+            if not wait:
+                return view(request, *args, **kwargs)
+            response = render(
+                request,
+                'core/429.html',
+                {'retry_after': math.ceil(wait)},
+                status=429
+            )
+            response['Retry-After'] = math.ceil(wait)
+            return response
+        return wrapper
+    return decorator
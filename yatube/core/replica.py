@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .routers import REPLICA
+
+
+def refresh(source=None, target=None):
+    """
+    Копирует основную базу SQLite в файл реплики через online backup
+    API. Копия пишется во временный файл и подменяет реплику одним
+    переименованием, так что читатели видят либо старую копию, либо
+    новую целиком. Соединения Django открываются на каждый запрос
+    и сразу видят новый файл.
+    """
+    started = time.time()
+    source = source or settings.DATABASES[DEFAULT_DB_ALIAS]['NAME']
+    target = target or settings.DATABASES[REPLICA]['NAME']
+    temporary = target + '.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    with closing(sqlite3.connect(source)) as primary, \
+            closing(sqlite3.connect(temporary)) as copy:
+        primary.backup(copy)
+        # Режим WAL копируется вместе с заголовком файла, а файлы -wal
+        # и -shm не пережили бы подмену реплики.
+        copy.execute('PRAGMA journal_mode = DELETE')
+    # Время изменения файла — начало копирования: по нему
+    # routers.covers() судит, какие записи в реплике уже есть.
+    os.utime(temporary, (started, started))
+    os.replace(temporary, target)
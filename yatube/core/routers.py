@@ -0,0 +1,118 @@
+"""
+Чтение лент с реплики, запись — в основную базу.
+
+Вьюхи, обёрнутые в read_from_replica, на время GET-запроса читают
+из базы REPLICA — копии основной, которую обновляет refresh_replica.
+Посетитель, который только что что-то записал, получает на
+REPLICA_STICKY_SECONDS куку REPLICA_STICKY_COOKIE и до её истечения
+читает из основной базы: свою запись он увидит сразу, даже если
+реплика ещё не обновилась. С реплики читаются только модели
+REPLICA_APPS: сессия и пользователь всегда берутся из основной
+базы, иначе только что вошедший посетитель выглядел бы анонимом.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA = 'replica'
+REPLICA_STICKY_COOKIE = 'read_primary'
+# Приложения, модели которых читаются с реплики.
+REPLICA_APPS = ('posts',)
+# Запись видна в реплике, только если копия начата позже её фиксации;
+# время изменения отмечается сразу после COMMIT, запас — на разницу
+# часов и округление mtime.
+REPLICA_COMMIT_MARGIN = 1
+
+_local = threading.local()
+
+
+def version():
+    """Когда начато копирование текущей реплики; None, если её нет."""
+    name = settings.DATABASES.get(REPLICA, {}).get('NAME')
+    try:
+        return os.stat(name).st_mtime
+    except (TypeError, OSError):
+        return None
+
+
+def available():
+    """Есть ли реплика и не отстала ли она больше REPLICA_MAX_LAG."""
+    started = version()
+    if started is None:
+        return False
+    return time.time() - started <= settings.REPLICA_MAX_LAG
+
+
+def reading_replica():
+    """Читает ли этот поток сейчас из реплики."""
+    return getattr(_local, 'replica', False)
+
+
+def covers(changed_at):
+    """Есть ли в реплике изменения, сделанные к моменту changed_at."""
+    started = version()
+    return (
+        started is not None
+        and started >= changed_at + REPLICA_COMMIT_MARGIN
+    )
+
+
+@contextmanager
+def primary():
+    """Внутри блока поток читает из основной базы."""
+    previous = reading_replica()
+    _local.replica = False
+    try:
+        yield
+    finally:
+        _local.replica = previous
+
+
+def read_from_replica(view):
+    """Вьюха читает из реплики, если посетитель недавно не писал."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD')
+                or REPLICA_STICKY_COOKIE in request.COOKIES
+                or not available()):
+            return view(request, *args, **kwargs)
+        _local.replica = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _local.replica = False
+    return wrapper
+
+
+def start_request():
+    _local.wrote = False
+
+
+def wrote():
+    """Писал ли этот поток в базу с начала запроса."""
+    return getattr(_local, 'wrote', False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_replica() and model._meta.app_label in REPLICA_APPS:
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Объект, прочитанный с реплики, всё равно пишется в основную.
+        _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — та же база, только чуть позже.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схему реплика получает вместе с данными при обновлении.
+        return db != REPLICA
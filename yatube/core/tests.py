@@ -0,0 +1,348 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection, router
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from posts.models import Post
+
+from . import ratelimit, replica, routers
+from .backends.sqlite3 import base
+from .cache_backends import SQLiteCache
+
+User = get_user_model()
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        options.setdefault('STATS_FLUSH_INTERVAL', 0)
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_entries_are_shared_between_instances(self):
+        """Второй экземпляр (другой процесс) видит записи первого."""
+        other = self.make_cache()
+        self.cache.set('key', {'value': [1, 2]})
+        self.assertEqual(other.get('key'), {'value': [1, 2]})
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_incr_and_expiry(self):
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter', 10), 11)
+        self.assertEqual(self.cache.decr('counter'), 10)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('short', 'value', 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 'again'))
+
+    def test_lru_eviction(self):
+        cache = self.make_cache(
+            MAX_ENTRIES=3, CULL_FREQUENCY=3, LRU_RESOLUTION=0
+        )
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+            time.sleep(0.01)
+        # Обращение к «a» делает самой старой запись «b».
+        cache.get('a')
+        cache.set('d', 'd')
+        self.assertEqual(
+            cache.get_many(['a', 'b', 'c', 'd']),
+            {'a': 'a', 'c': 'c', 'd': 'd'}
+        )
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_throttle(self):
+        """Маркеры берутся из всех вёдер сразу или ни из одного."""
+        for _ in range(3):
+            self.assertEqual(self.cache.throttle(['a', 'b'], 10, 3), 0)
+        wait = self.cache.throttle(['a', 'b'], 10, 3)
+        self.assertGreater(wait, 9)
+        self.assertLessEqual(wait, 10)
+        # Отказ по «a» не тратит маркеры «c».
+        self.assertGreater(self.cache.throttle(['c', 'a'], 10, 3), 0)
+        for _ in range(3):
+            self.assertEqual(self.cache.throttle(['c'], 10, 3), 0)
+        self.assertEqual(self.cache.throttle(['d'], 0.01, 1), 0)
+        time.sleep(0.02)
+        self.assertEqual(self.cache.throttle(['d'], 0.01, 1), 0)
+
+    def test_stats(self):
+        self.cache.set('key', 'value')
+        self.cache.get('key')
+        self.cache.get('missing')
+        stats = self.make_cache().stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_entries_are_counted_without_scanning(self):
+        """Число записей ведут триггеры, в том числе при замене."""
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.cache.set('a', 3)
+        self.cache.add('b', 4)
+        self.cache.add('c', 5)
+        self.assertEqual(self.cache.stats()['entries'], 3)
+        self.cache.delete('a')
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.cache.clear()
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+
+def server_timing(response):
+    """Метрики заголовка Server-Timing: {имя: {параметр: значение}}."""
+    metrics = {}
+    for metric in response['Server-Timing'].split(', '):
+        name, *params = metric.split(';')
+        metrics[name] = dict(param.split('=') for param in params)
+    return metrics
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_header(self):
+        response = self.client.get(reverse('posts:index'))
+        metrics = server_timing(response)
+        self.assertGreater(int(metrics['db-count']['desc']), 0)
+        for name in ('total', 'db', 'tmpl', 'cache'):
+            self.assertGreaterEqual(float(metrics[name]['dur']), 0)
+        self.assertLessEqual(
+            float(metrics['db']['dur']), float(metrics['total']['dur'])
+        )
+
+    def test_cache_hit_ratio(self):
+        """Второй показ главной берёт фрагменты из кэша."""
+        first = server_timing(self.client.get(reverse('posts:index')))
+        second = server_timing(self.client.get(reverse('posts:index')))
+        self.assertGreater(
+            float(second['cache-hit']['desc']),
+            float(first['cache-hit']['desc'])
+        )
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_sampled_out(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(SERVER_TIMING_LOG=True)
+    def test_log_line(self):
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            self.client.get(reverse('posts:index'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], reverse('posts:index'))
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_count'], 0)
+
+
+class ReplicaTests(TestCase):
+    def test_refresh_copies_primary(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source = os.path.join(directory.name, 'primary.sqlite3')
+        target = os.path.join(directory.name, 'replica.sqlite3')
+        primary = sqlite3.connect(source)
+        self.addCleanup(primary.close)
+        primary.execute('CREATE TABLE post (text TEXT)')
+        primary.execute("INSERT INTO post VALUES ('первый')")
+        primary.commit()
+        replica.refresh(source, target)
+        primary.execute("INSERT INTO post VALUES ('второй')")
+        primary.commit()
+        replica.refresh(source, target)
+        copy = sqlite3.connect(target)
+        self.addCleanup(copy.close)
+        self.assertEqual(
+            copy.execute('SELECT COUNT(*) FROM post').fetchone()[0], 2
+        )
+
+    def test_feed_views_read_from_replica(self):
+        @routers.read_from_replica
+        def view(request):
+            return router.db_for_read(Post)
+
+        factory = RequestFactory()
+        sticky = factory.get('/')
+        sticky.COOKIES[routers.REPLICA_STICKY_COOKIE] = '1'
+        with patch.object(routers, 'available', return_value=True):
+            self.assertEqual(view(factory.get('/')), routers.REPLICA)
+            self.assertEqual(view(factory.post('/')), 'default')
+            self.assertEqual(view(sticky), 'default')
+        self.assertEqual(view(factory.get('/')), 'default')
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_sessions_and_users_are_read_from_primary(self):
+        """Только что вошедший посетитель не выглядит анонимом."""
+        @routers.read_from_replica
+        def view(request):
+            return [
+                router.db_for_read(model) for model in (Post, User, Session)
+            ]
+
+        with patch.object(routers, 'available', return_value=True):
+            self.assertEqual(
+                view(RequestFactory().get('/')),
+                [routers.REPLICA, 'default', 'default']
+            )
+        self.assertEqual(router.db_for_write(Post), 'default')
+
+    def test_stale_replica_is_not_cached(self):
+        """Страница, изменённая после копирования реплики, — из основной."""
+        cache.clear()
+        user = User.objects.create_user(username='writer')
+        Post.objects.create(author=user, text='text')
+        reads = []
+
+        def db_for_read(self, model, **hints):
+            reads.append(routers.reading_replica())
+            return 'default'
+
+        url = reverse('posts:index')
+        route = patch.object(
+            routers.PrimaryReplicaRouter, 'db_for_read', db_for_read
+        )
+        with patch.object(routers, 'available', return_value=True), route:
+            with patch.object(routers, 'version', return_value=0):
+                self.client.get(url)
+            # Состояние прочитано из реплики, страница — из основной.
+            self.assertTrue(reads[0])
+            self.assertFalse(reads[-1])
+            reads.clear()
+            cache.clear()
+            fresh = time.time() + 10
+            with patch.object(routers, 'version', return_value=fresh):
+                self.client.get(url)
+            self.assertTrue(all(reads))
+
+    def test_writes_make_reads_sticky(self):
+        user = User.objects.create_user(username='writer')
+        post = Post.objects.create(author=user, text='text')
+        self.client.force_login(user)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn(routers.REPLICA_STICKY_COOKIE, response.cookies)
+        response = self.client.post(
+            reverse('posts:add_comment', args=(post.pk,)),
+            {'text': 'comment'}
+        )
+        self.assertIn(routers.REPLICA_STICKY_COOKIE, response.cookies)
+
+
+@override_settings(
+    RATELIMIT_ENABLED=True,
+    RATELIMITS={'add_comment': '2/m', 'signup': '1/h'}
+)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='writer')
+        self.post = Post.objects.create(author=self.user, text='text')
+        self.client.force_login(self.user)
+
+    def test_comments_are_limited(self):
+        url = reverse('posts:add_comment', args=[self.post.pk])
+        for _ in range(2):
+            response = self.client.post(url, {'text': 'comment'})
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(url, {'text': 'comment'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.post.comments.count(), 2)
+        # Чтение страницы поста не ограничено.
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        self.assertEqual(response.status_code, 200)
+        # Тот же пользователь с другого адреса упирается в своё ведро.
+        response = self.client.post(
+            url, {'text': 'comment'}, REMOTE_ADDR='10.0.0.2'
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_signup_is_limited_by_ip(self):
+        self.client.logout()
+        url = reverse('users:signup')
+        self.client.post(url, {'username': 'first'})
+        self.assertEqual(self.client.post(url).status_code, 429)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    def test_client_address_behind_proxies(self):
+        """За своими прокси ведро — по адресу из X-Forwarded-For."""
+        factory = RequestFactory()
+        request = factory.post(
+            '/', REMOTE_ADDR='10.0.0.1',
+            HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.5, 10.0.0.9'
+        )
+        cases = {0: '10.0.0.1', 1: '10.0.0.9', 2: '203.0.113.5', 4: '10.0.0.1'}
+        for proxies, address in cases.items():
+            with self.subTest(proxies=proxies), \
+                    self.settings(RATELIMIT_TRUSTED_PROXIES=proxies):
+                self.assertEqual(ratelimit.client_ip(request), address)
+        with self.settings(RATELIMIT_TRUSTED_PROXIES=1):
+            self.client.logout()
+            url = reverse('users:signup')
+            self.client.post(url, HTTP_X_FORWARDED_FOR='203.0.113.5')
+            response = self.client.post(
+                url, HTTP_X_FORWARDED_FOR='203.0.113.5'
+            )
+            self.assertEqual(response.status_code, 429)
+            response = self.client.post(
+                url, HTTP_X_FORWARDED_FOR='203.0.113.6'
+            )
+            self.assertEqual(response.status_code, 200)
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_busy_retry(self):
+        class Connection:
+            in_transaction = False
+
+        attempts = []
+
+        def call():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise sqlite3.OperationalError('database is locked')
+            return 'done'
+
+        with patch.object(base.time, 'sleep') as sleep:
+            self.assertEqual(base.retry_busy(call, 5, Connection()), 'done')
+            self.assertEqual(sleep.call_count, 2)
+            attempts.clear()
+            with self.assertRaises(sqlite3.OperationalError):
+                base.retry_busy(call, 1, Connection())
+            # В транзакции повторять запрос нельзя.
+            attempts.clear()
+            Connection.in_transaction = True
+            with self.assertRaises(sqlite3.OperationalError):
+                base.retry_busy(call, 5, Connection())
+            self.assertEqual(len(attempts), 1)
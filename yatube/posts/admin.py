@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Post, Group
 
 
@@ -10,6 +11,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Вместо LIKE '%слово%' по всей таблице — поиск по индексу.
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            pk__in=search.matching(search_term).values('pk')
+        ), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
@@ -0,0 +1,260 @@
+import calendar
+import hashlib
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
+
+from core import routers
+
+from .models import Group, Post, User
+
+KEY_PREFIX = 'generation:'
+CHANGED_PREFIX = 'changed:'
+PAGE_PREFIX = 'anonymous_page:'
+CARD_PREFIX = 'post_card:'
+# Все ленты, где выводятся посты разных авторов: главная и подписки.
+POSTS_SCOPE = 'posts'
+# Рейтинги популярного: меняются при каждом пересчёте.
+TRENDING_SCOPE = 'trending'
+
+
+def _fresh():
+    # Новое поколение никогда не совпадает со старым, даже если ключ
+    # был вытеснен из кэша или кэш очищен целиком.
+    return int(time.time() * 1000)
+
+
+def _generations(scopes, extra_keys=()):
+    keys = [KEY_PREFIX + scope for scope in scopes]
+    found = cache.get_many(keys + list(extra_keys))
+    missing = {key: _fresh() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys], found
+
+
+def generations(*scopes):
+    """Текущие поколения областей, одним запросом к кэшу."""
+    return _generations(scopes)[0]
+
+
+def bump(*scopes):
+    """
+    Делает устаревшими все фрагменты, построенные по этим областям, —
+    после фиксации текущей транзакции. Иначе параллельный читатель
+    увидел бы новое поколение раньше новых строк и закэшировал бы под
+    ним страницу со старыми данными.
+    """
+    scopes = set(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = KEY_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh(), None)
+    now = time.time()
+    cache.set_many({CHANGED_PREFIX + scope: now for scope in scopes}, None)
+
+
+def _timeout():
+    # Разброс, чтобы записи не истекали одновременно.
+    timeout = settings.FEED_CACHE_TIMEOUT
+    return timeout + random.randint(0, timeout // 10)
+
+
+def card_key(template_name, post):
+    """Ключ карточки поста: меняется вместе с updated_at."""
+    return '%s%s:%s:%s' % (
+        CARD_PREFIX, template_name, post.pk, post.updated_at.timestamp()
+    )
+
+
+def cached_cards(posts, template_name, render):
+    """
+    HTML карточек постов в их порядке. Готовые карточки берутся
+    из кэша одним get_many; render(post) строит только недостающие,
+    и они кладутся в кэш одним set_many.
+    """
+    posts = list(posts)
+    keys = [card_key(template_name, post) for post in posts]
+    found = cache.get_many(keys)
+    missing = {
+        key: render(post)
+        for key, post in zip(keys, posts) if key not in found
+    }
+    if missing:
+        cache.set_many(missing, _timeout())
+        found.update(missing)
+    return [mark_safe(found[key]) for key in keys]
+
+
+def touch_posts(posts):
+    """Сдвигает версию карточек постов, когда правка их не задела."""
+    return posts.update(updated_at=timezone.now())
+
+
+def group_scope(group_id):
+    return 'group:%s' % group_id
+
+
+def profile_scope(author_id):
+    return 'profile:%s' % author_id
+
+
+def follow_scope(user_id):
+    return 'follow:%s' % user_id
+
+
+def post_scope(post_id):
+    return 'post:%s' % post_id
+
+
+def post_scopes(post, *group_ids):
+    """Все области, в которых выводится пост."""
+    scopes = [
+        POSTS_SCOPE,
+        profile_scope(post.author_id),
+        post_scope(post.pk),
+    ]
+    scopes += [
+        group_scope(group_id)
+        for group_id in (post.group_id,) + group_ids
+        if group_id is not None
+    ]
+    return scopes
+
+
+def _timestamp(value):
+    return calendar.timegm(value.utctimetuple()) if value else 0
+
+
+def index_state(request):
+    newest = Post.objects.aggregate(newest=Max('pub_date'))['newest']
+    return [POSTS_SCOPE], newest
+
+
+def popular_state(request):
+    # Посты на вкладке правятся вместе с общей лентой.
+    return [POSTS_SCOPE, TRENDING_SCOPE], None
+
+
+def group_state(request, slug):
+    found = Group.objects.filter(slug=slug).annotate(
+        newest=Max('posts__pub_date')
+    ).values_list('pk', 'newest').first()
+    if found is None:
+        return None
+    group_id, newest = found
+    return [group_scope(group_id)], newest
+
+
+def profile_state(request, username):
+    found = User.objects.filter(username=username).annotate(
+        newest=Max('posts__pub_date')
+    ).values_list('pk', 'newest').first()
+    if found is None:
+        return None
+    author_id, newest = found
+    return [profile_scope(author_id)], newest
+
+
+def post_state(request, post_id):
+    found = Post.objects.filter(pk=post_id).annotate(
+        newest=Max('comments__pub_date')
+    ).values_list('pub_date', 'newest', 'author_id', 'group_id').first()
+    if found is None:
+        return None
+    pub_date, newest, author_id, group_id = found
+    scopes = [post_scope(post_id), profile_scope(author_id)]
+    if group_id is not None:
+        scopes.append(group_scope(group_id))
+    return scopes, max(pub_date, newest or pub_date)
+
+
+def _serve_cached(key):
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+
+def anonymous_page(state):
+    """
+    Полностраничный кэш и условный GET для анонимных посетителей.
+
+    state(request, *args, **kwargs) возвращает области страницы
+    и дату новейшей записи в ней (или None, если объекта нет — тогда
+    страницу строит сама вьюха). Из поколений областей, этой даты
+    и адреса запроса складывается ETag, поэтому повторный запрос
+    с If-None-Match получает 304 без обращения к шаблонам, а готовый
+    HTML берётся из кэша. Last-Modified — новейшая из дат публикации
+    и последнего изменения областей, чтобы правки тоже его сдвигали.
+    Если вьюха читает из реплики, а та скопирована раньше последнего
+    изменения областей, страница строится по основной базе.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            found = state(request, *args, **kwargs)
+            if found is None:
+                return view(request, *args, **kwargs)
+            scopes, newest = found
+            versions, values = _generations(
+                scopes, [CHANGED_PREFIX + scope for scope in scopes]
+            )
+            changed_at = max(
+                values.get(CHANGED_PREFIX + scope, 0) for scope in scopes
+            )
+            if routers.reading_replica() and not routers.covers(changed_at):
+                # Реплика ещё не видела последних правок страницы:
+                # старый HTML попал бы в кэш под новым ETag.
+                with routers.primary():
+                    return wrapper(request, *args, **kwargs)
+            last_modified = int(max(_timestamp(newest), changed_at))
+            etag = hashlib.md5(':'.join(
+                [request.get_full_path(), str(newest)] + list(map(
+                    str, versions
+                ))
+            ).encode()).hexdigest()
+            response = get_conditional_response(
+                request,
+                etag=quote_etag(etag),
+                last_modified=last_modified
+            )
+            if response is None:
+                key = PAGE_PREFIX + etag
+                response = _serve_cached(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if (response.status_code == 200 and not response.streaming
+                        and not response.cookies):
+                    cache.set(
+                        key,
+                        (response.content, response['Content-Type']),
+                        settings.FEED_CACHE_TIMEOUT
+                    )
+            response['ETag'] = quote_etag(etag)
+            response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
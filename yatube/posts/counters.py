@@ -0,0 +1,79 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _shift(queryset, field, delta):
+    if delta < 0:
+        # Не уводим счётчик ниже нуля, даже если он разошёлся с данными.
+        queryset = queryset.filter(**{field + '__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def shift_user(user_id, field, delta):
+    """Сдвигает счётчик пользователя, при необходимости заводя запись."""
+    if user_id is None:
+        return
+    updated = _shift(UserStats.objects.filter(user_id=user_id), field, delta)
+    # При удалении пользователя каскадом его счётчики уже удалены —
+    # заводить их заново нельзя.
+    if not updated and delta > 0:
+        UserStats.objects.get_or_create(user_id=user_id)
+        _shift(UserStats.objects.filter(user_id=user_id), field, delta)
+
+
+def shift_group(group_id, delta):
+    if group_id is not None:
+        _shift(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def shift_post(post_id, delta):
+    if post_id is not None:
+        _shift(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def _count(queryset, field):
+    """Коррелированный подзапрос COUNT(*) по внешнему ключу field."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        0
+    )
+
+
+def _only(queryset, ids):
+    return queryset if ids is None else queryset.filter(pk__in=ids)
+
+
+def rebuild(user_ids=None, group_ids=None, post_ids=None):
+    """
+    Пересчитывает счётчики по исходным таблицам: все или, если
+    переданы id, только у этих пользователей, групп и постов.
+    """
+    UserStats.objects.bulk_create(
+        [
+            UserStats(user_id=user_id)
+            for user_id in _only(User.objects, user_ids).filter(
+                stats__isnull=True
+            ).values_list('pk', flat=True)
+        ],
+        ignore_conflicts=True
+    )
+    stats = UserStats.objects.all()
+    if user_ids is not None:
+        stats = stats.filter(user_id__in=user_ids)
+    stats.update(
+        posts_count=_count(Post.objects.all(), 'author'),
+        followers_count=_count(Follow.objects.all(), 'author'),
+        following_count=_count(Follow.objects.all(), 'user'),
+    )
+    _only(Group.objects, group_ids).update(
+        posts_count=_count(Post.objects.all(), 'group')
+    )
+    _only(Post.objects, post_ids).update(
+        comments_count=_count(Comment.objects.all(), 'post')
+    )
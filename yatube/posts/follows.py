@@ -0,0 +1,94 @@
+"""
+Граф подписок в кэше.
+
+Для каждого читателя хранится множество авторов, на которых он
+подписан, — отсортированный массив целых чисел, упакованный в байты
+(4 байта на подписку). Проверка подписки — двоичный поиск по массиву
+без запросов к базе. При подписке и отписке запись сбрасывается после
+фиксации транзакции, а если записи в кэше нет, она строится заново
+одним запросом. Число подписчиков хранит UserStats.followers_count.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+FOLLOWING_PREFIX = 'follow_graph:following:'
+# Беззнаковое 32-битное целое: на всех платформах, где работает Django.
+TYPECODE = 'I'
+
+
+def _pack(author_ids):
+    return array(TYPECODE, sorted(set(author_ids))).tobytes()
+
+
+def _unpack(packed):
+    ids = array(TYPECODE)
+    ids.frombytes(packed)
+    return ids
+
+
+def _contains(ids, author_id):
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def _following(user_id):
+    key = FOLLOWING_PREFIX + str(user_id)
+    packed = cache.get(key)
+    if packed is None:
+        packed = _pack(Follow.objects.filter(
+            user_id=user_id
+        ).values_list('author_id', flat=True))
+        cache.set(key, packed, settings.FOLLOW_GRAPH_TIMEOUT)
+    return _unpack(packed)
+
+
+def following(user_id):
+    """Авторы, на которых подписан читатель, по возрастанию id."""
+    if user_id is None:
+        return []
+    return list(_following(user_id))
+
+
+def is_following(user_id, author_id):
+    if user_id is None or author_id is None:
+        return False
+    return _contains(_following(user_id), author_id)
+
+
+def followed_among(user_id, author_ids):
+    """Кто из авторов author_ids есть в подписках читателя."""
+    if user_id is None:
+        return set()
+    ids = _following(user_id)
+    return {
+        author_id for author_id in set(author_ids)
+        if author_id is not None and _contains(ids, author_id)
+    }
+
+
+def forget(user_id):
+    """Сбрасывает подписки читателя: построятся заново из базы."""
+    cache.delete(FOLLOWING_PREFIX + str(user_id))
+
+
+def forget_many(user_ids):
+    """Сбрасывает подписки нескольких читателей."""
+    cache.delete_many(
+        [FOLLOWING_PREFIX + str(user_id) for user_id in user_ids]
+    )
+
+
+def changed(user_id):
+    """
+    Подписки читателя изменились. Запись сбрасывается после COMMIT:
+    правка до него разошлась бы с таблицей при откате транзакции,
+    а чтение из базы до него вернуло бы прежние подписки.
+    """
+    if user_id is not None:
+        transaction.on_commit(lambda: forget(user_id))
@@ -0,0 +1,81 @@
+"""
+Построение вариантов картинки разной ширины.
+
+Модуль не зависит от Django: его функции выполняются в отдельных
+процессах, которые получают байты исходника и возвращают байты
+готовых файлов, а сохранением занимается основной процесс.
+"""
+import io
+
+from PIL import Image
+
+WEBP = 'WEBP'
+# Форматы, в которых варианты сохраняются для браузеров без WebP.
+FALLBACK_FORMATS = ('JPEG', 'PNG')
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+MIME_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+SAVE_OPTIONS = {
+    'WEBP': {'quality': 80, 'method': 4},
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+}
+
+
+def fallback_format(source_format):
+    """Формат без WebP: исходный, если его понимают все браузеры."""
+    if source_format in FALLBACK_FORMATS:
+        return source_format
+    # GIF с палитрой и прозрачностью лучше сохраняется в PNG.
+    return 'PNG' if source_format == 'GIF' else 'JPEG'
+
+
+def _sizes(width, height, widths, height_ratio):
+    """
+    Размеры вариантов: каждый вписан в рамку шириной w и высотой
+    w * height_ratio, картинка не увеличивается. Совпадающие размеры
+    отбрасываются, так что маленький исходник даёт один вариант.
+    """
+    sizes = []
+    for box_width in sorted(widths):
+        scale = min(
+            box_width / width,
+            box_width * height_ratio / height,
+            1,
+        )
+        size = (max(round(width * scale), 1), max(round(height * scale), 1))
+        if size not in sizes:
+            sizes.append(size)
+    return sizes
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **SAVE_OPTIONS[image_format])
+    return buffer.getvalue()
+
+
+def render_variants(data, widths, height_ratio):
+    """
+    Варианты картинки data для каждой ширины из widths в WebP
+    и в запасном формате: список (ширина, высота, формат, байты).
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        fallback = fallback_format(source.format)
+        source.load()
+        image = source.convert(
+            'RGBA' if 'A' in source.getbands() or 'transparency'
+            in source.info else 'RGB'
+        )
+    variants = []
+    for size in _sizes(*image.size, widths, height_ratio):
+        resized = (
+            image if size == image.size
+            else image.resize(size, Image.LANCZOS)
+        )
+        for image_format in (WEBP, fallback):
+            variants.append(
+                (*size, image_format, _encode(resized, image_format))
+            )
+    return variants
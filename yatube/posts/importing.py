@@ -0,0 +1,441 @@
+"""
+Массовый импорт пользователей, групп, постов, комментариев и подписок.
+
+Записи копятся в буферах по типам и пишутся пачками через bulk_create,
+каждая пачка — в своей транзакции. bulk_create не шлёт сигналов,
+поэтому счётчики, ленты подписок, поисковый индекс, варианты картинок
+и кэш пересчитываются один раз в конце, а не на каждую строку, —
+и только для затронутых импортом записей.
+"""
+import csv
+import json
+import os
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching, counters, follows, search, thumbnails, timeline
+from .models import Comment, Follow, Group, Post, User, render_text
+
+# Порядок записи пачки: записи ссылаются только на предыдущие типы.
+KINDS = ('user', 'group', 'post', 'comment', 'follow')
+MODELS = {
+    'user': User,
+    'group': Group,
+    'post': Post,
+    'comment': Comment,
+    'follow': Follow,
+}
+# Записи с датой из файла: auto_now_add ставит им текущее время.
+DATED_KINDS = ('post', 'comment')
+# Столько id за раз попадает в условие IN при пересчёте производных.
+IDS_BATCH_SIZE = 500
+# Какие id записей, затронутых импортом, нужны apply_side_effects.
+TOUCHED = (
+    'user', 'group', 'post', 'author', 'commented', 'follower', 'followed'
+)
+# В какие таблицы шла запись, если затронуты такие id.
+TOUCHED_KINDS = {
+    'user': 'user',
+    'group': 'group',
+    'post': 'post',
+    'commented': 'comment',
+    'follower': 'follow',
+}
+
+
+class RecordError(ValueError):
+    """Входной файл нельзя прочитать как поток записей."""
+
+
+def kind_from_name(path):
+    """Тип записей CSV по имени файла: users.csv → user."""
+    stem = os.path.splitext(os.path.basename(path))[0].lower()
+    for kind in KINDS:
+        if stem in (kind, kind + 's'):
+            return kind
+    return None
+
+
+def read_records(path, file_format=None, kind=None):
+    """
+    Записи файла по одной: пары (тип, словарь полей).
+    В NDJSON тип берётся из поля type, в CSV — из kind или имени файла.
+    """
+    if file_format is None:
+        file_format = 'csv' if path.endswith('.csv') else 'ndjson'
+    if file_format == 'csv':
+        kind = kind or kind_from_name(path)
+        if kind is None:
+            raise RecordError(
+                'Не понять тип записей в %s: укажите --type.' % path
+            )
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            for row in csv.DictReader(file):
+                yield kind, row
+            return
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                raise RecordError('%s:%s: %s' % (path, number, error))
+            yield record.pop('type', kind), record
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _pub_date(value):
+    if not value:
+        return timezone.now()
+    parsed = parse_datetime(value)
+    if parsed is None:
+        return timezone.now()
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.utc)
+    return parsed
+
+
+def _assign_pks(model, objects):
+    """
+    Выдаёт id записям без него: bulk_create в SQLite id не возвращает,
+    а по ним потом ставятся даты и пересчитываются производные.
+    Вызывается в транзакции flush(): core.backends.sqlite3 начинает её
+    с BEGIN IMMEDIATE, так что между чтением MAX(id) и вставкой другие
+    процессы в базу не пишут.
+    """
+    missing = [obj for obj in objects if obj.pk is None]
+    if not missing:
+        return
+    last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    last = max([last] + [obj.pk for obj in objects if obj.pk is not None])
+    for pk, obj in enumerate(missing, last + 1):
+        obj.pk = pk
+
+
+def _written(model, pks, written_since):
+    """
+    Какие из pks записал последний bulk_create: auto_now_add поставил
+    им время не раньше written_since, а старые строки с теми же id,
+    пропущенные как конфликты, записаны раньше.
+    """
+    return set(model.objects.filter(
+        pk__in=pks, pub_date__gte=written_since
+    ).values_list('pk', flat=True))
+
+
+def _total_changes():
+    """Сколько строк изменило соединение с момента открытия."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT total_changes()')
+        return cursor.fetchone()[0]
+
+
+def _restore_pub_dates(model, dates):
+    """Ставит записанным строкам даты из файла вместо времени записи."""
+    meta = model._meta
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'UPDATE {table} SET {date} = %s WHERE {pk} = %s'
+            .format(
+                table=connection.ops.quote_name(meta.db_table),
+                date=connection.ops.quote_name(
+                    meta.get_field('pub_date').column
+                ),
+                pk=connection.ops.quote_name(meta.pk.column),
+            ),
+            [(adapt(pub_date), pk) for pk, pub_date in dates]
+        )
+
+
+def _batches(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), IDS_BATCH_SIZE):
+        yield ids[start:start + IDS_BATCH_SIZE]
+
+
+class Importer:
+    """
+    Буферизует записи и пишет их пачками по batch_size.
+    progress(kind, count, rate) вызывается после каждой пачки.
+    """
+
+    def __init__(self, batch_size=1000, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.buffers = {kind: [] for kind in KINDS}
+        self.imported = Counter()
+        self.skipped = Counter()
+        self.started = time.monotonic()
+        # id записей, затронутых импортом, для apply_side_effects.
+        self.touched = {name: set() for name in TOUCHED}
+
+    @property
+    def total(self):
+        return sum(self.imported.values())
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.total / elapsed if elapsed else 0.0
+
+    def add(self, kind, record):
+        """Кладёт запись в буфер; True, если пора вызвать flush()."""
+        if kind not in self.buffers:
+            self.skipped[kind or 'unknown'] += 1
+            return False
+        buffer = self.buffers[kind]
+        buffer.append(record)
+        return len(buffer) >= self.batch_size
+
+    def flush(self):
+        """Пишет все буферы одной транзакцией."""
+        with transaction.atomic():
+            for kind in KINDS:
+                records = self.buffers[kind]
+                if not records:
+                    continue
+                objects, written = self._write(kind, records)
+                self._remember(kind, objects)
+                self.imported[kind] += written
+                self.skipped[kind] += len(records) - written
+                self.buffers[kind] = []
+                if self.progress:
+                    self.progress(kind, self.imported[kind], self.rate)
+
+    def _write(self, kind, records):
+        """
+        Пишет записи одного типа. Возвращает затронутые объекты
+        и число действительно записанных строк.
+        """
+        model = MODELS[kind]
+        objects = getattr(self, '_%ss' % kind)(records)
+        if kind in DATED_KINDS:
+            _assign_pks(model, objects)
+            # bulk_create перезапишет даты текущим временем.
+            dates = {obj.pk: obj.pub_date for obj in objects}
+            written_since = timezone.now()
+        else:
+            changes = _total_changes()
+        # Повторный импорт после сбоя не дублирует записи
+        # с уникальными ключами: конфликты пропускаются.
+        # Размер одного INSERT Django подбирает сам: у SQLite
+        # есть предел числа строк в составном SELECT.
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+        if kind not in DATED_KINDS:
+            # Какие строки пропущены как конфликты, неизвестно:
+            # производные пересчитываются и для них, это безвредно.
+            return objects, _total_changes() - changes
+        written = _written(model, list(dates), written_since)
+        _restore_pub_dates(
+            model, [(pk, dates[pk]) for pk in sorted(written)]
+        )
+        return [obj for obj in objects if obj.pk in written], len(written)
+
+    def touched_ids(self):
+        """Затронутые id в виде, пригодном для JSON."""
+        return {name: sorted(ids) for name, ids in self.touched.items()}
+
+    def restore_touched(self, touched):
+        """Добавляет id, затронутые прерванным импортом (из touched_ids)."""
+        for name, ids in touched.items():
+            if name in self.touched:
+                self.touched[name].update(ids)
+
+    def _remember(self, kind, objects):
+        touched = self.touched
+        if kind == 'user':
+            touched['user'].update(self._user_ids(
+                obj.username for obj in objects
+            ).values())
+        elif kind == 'group':
+            touched['group'].update(Group.objects.filter(
+                slug__in=[obj.slug for obj in objects]
+            ).values_list('pk', flat=True))
+        elif kind == 'post':
+            for post in objects:
+                touched['post'].add(post.pk)
+                touched['author'].add(post.author_id)
+                if post.group_id is not None:
+                    touched['group'].add(post.group_id)
+        elif kind == 'comment':
+            touched['commented'].update(obj.post_id for obj in objects)
+        elif kind == 'follow':
+            for follow in objects:
+                touched['follower'].add(follow.user_id)
+                touched['followed'].add(follow.author_id)
+
+    # Построение объектов
+
+    @staticmethod
+    def _user_ids(usernames):
+        return dict(User.objects.filter(
+            username__in=set(usernames)
+        ).values_list('username', 'pk'))
+
+    def _users(self, records):
+        return [
+            User(
+                username=record['username'],
+                first_name=record.get('first_name') or '',
+                last_name=record.get('last_name') or '',
+                email=record.get('email') or '',
+                # Хеш пароля переносится как есть; без него вход закрыт.
+                password=record.get('password') or make_password(None),
+            )
+            for record in records if record.get('username')
+        ]
+
+    def _groups(self, records):
+        return [
+            Group(
+                slug=record['slug'],
+                title=record.get('title') or record['slug'],
+                description=record.get('description') or '',
+            )
+            for record in records if record.get('slug')
+        ]
+
+    def _posts(self, records):
+        users = self._user_ids(record.get('author') for record in records)
+        groups = dict(Group.objects.filter(
+            slug__in={record.get('group') for record in records}
+        ).values_list('slug', 'pk'))
+        posts = []
+        for record in records:
+            author_id = users.get(record.get('author'))
+            group = record.get('group')
+            if author_id is None or (group and group not in groups):
+                continue
+            posts.append(Post(
+                pk=_as_int(record.get('id')),
+                author_id=author_id,
+                group_id=groups.get(group),
+                text=record.get('text') or '',
+                text_html=render_text(record.get('text') or ''),
+                image=record.get('image') or '',
+                pub_date=_pub_date(record.get('pub_date')),
+            ))
+        return posts
+
+    def _comments(self, records):
+        users = self._user_ids(record.get('author') for record in records)
+        post_ids = set(Post.objects.filter(
+            pk__in={_as_int(record.get('post')) for record in records}
+        ).values_list('pk', flat=True))
+        return [
+            Comment(
+                pk=_as_int(record.get('id')),
+                post_id=_as_int(record.get('post')),
+                author_id=users[record['author']],
+                text=record.get('text') or '',
+                text_html=render_text(record.get('text') or ''),
+                pub_date=_pub_date(record.get('pub_date')),
+            )
+            for record in records
+            if record.get('author') in users
+            and _as_int(record.get('post')) in post_ids
+        ]
+
+    def _follows(self, records):
+        users = self._user_ids(
+            name for record in records
+            for name in (record.get('user'), record.get('author'))
+        )
+        return [
+            Follow(
+                user_id=users[record['user']],
+                author_id=users[record['author']],
+            )
+            for record in records
+            if record.get('user') in users
+            and record.get('author') in users
+            and record['user'] != record['author']
+        ]
+
+
+def _schedule_variants(post_ids):
+    """Ставит в очередь варианты картинок постов; возвращает их число."""
+    queued = 0
+    for batch in _batches(post_ids):
+        posts = Post.objects.filter(pk__in=batch).exclude(image='').only(
+            'pk', 'image', 'author_id', 'group_id'
+        )
+        for post in posts:
+            if thumbnails.ready_variants(post.image) is None:
+                thumbnails.schedule(
+                    post.image.name, caching.post_scopes(post)
+                )
+                queued += 1
+    return queued
+
+
+def _analyze(kinds):
+    """
+    Статистика для планировщика и для оценки числа постов в ленте —
+    только по таблицам, в которые шла запись.
+    """
+    with connection.cursor() as cursor:
+        for kind in kinds:
+            cursor.execute('ANALYZE %s' % connection.ops.quote_name(
+                MODELS[kind]._meta.db_table
+            ))
+
+
+def apply_side_effects(importer, log=None):
+    """
+    То, что при обычной записи делают сигналы, — для записей,
+    затронутых импортом: счётчики, ленты подписок, поисковый индекс,
+    варианты картинок, статистика базы и поколения областей кэша.
+    """
+    log = log or (lambda message: None)
+    touched = importer.touched
+    user_ids = (
+        touched['user'] | touched['author']
+        | touched['follower'] | touched['followed']
+    )
+    # Ленты зависят и от постов автора, и от числа его подписчиков.
+    author_ids = touched['author'] | touched['followed']
+    post_ids = touched['post'] | touched['commented']
+    with transaction.atomic():
+        for batch in _batches(user_ids):
+            counters.rebuild(user_ids=batch, group_ids=[], post_ids=[])
+        for batch in _batches(touched['group']):
+            counters.rebuild(user_ids=[], group_ids=batch, post_ids=[])
+        for batch in _batches(touched['commented']):
+            counters.rebuild(user_ids=[], group_ids=[], post_ids=batch)
+        log('Счётчики пересчитаны.')
+        for batch in _batches(author_ids):
+            timeline.rebuild(author_ids=batch)
+        log('Ленты подписок построены.')
+        for batch in _batches(post_ids):
+            search.index_posts(batch)
+        log('Поисковый индекс построен.')
+    queued = _schedule_variants(touched['post'])
+    log('Картинок в очереди на варианты: %s.' % queued)
+    _analyze(
+        kind for name, kind in TOUCHED_KINDS.items() if touched[name]
+    )
+    log('Статистика базы собрана.')
+    follows.forget_many(touched['follower'])
+    caching.bump(
+        caching.POSTS_SCOPE,
+        *[caching.profile_scope(pk) for pk in author_ids],
+        *[caching.group_scope(pk) for pk in touched['group']],
+        *[caching.post_scope(pk) for pk in touched['commented']],
+        *[caching.follow_scope(pk) for pk in touched['follower']]
+    )
+    log('Кэш затронутых лент сброшен.')
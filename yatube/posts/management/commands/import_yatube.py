@@ -0,0 +1,119 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import importing
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует пользователей, группы, посты, комментарии и подписки '
+        'из NDJSON или CSV пачками bulk_create.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+',
+            help='Файлы NDJSON (поле type в каждой строке) или CSV '
+                 '(тип по имени файла: users.csv, posts.csv, ...).'
+        )
+        parser.add_argument(
+            '--format', choices=('ndjson', 'csv'),
+            help='Формат файлов; по умолчанию — по расширению.'
+        )
+        parser.add_argument(
+            '--type', choices=importing.KINDS, dest='kind',
+            help='Тип записей, если он не указан в самих файлах.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл с позициями в импортируемых файлах: при повторном '
+                 'запуске уже записанные строки пропускаются, а производные '
+                 'пересчитываются и для записанных до сбоя.'
+        )
+        parser.add_argument(
+            '--skip-side-effects', action='store_true',
+            help='Не пересчитывать для записанных строк счётчики, ленты, '
+                 'индекс и кэш. С --checkpoint их пересчитает следующий '
+                 'запуск с тем же файлом.'
+        )
+
+    def handle(self, *args, **options):
+        positions, touched = self._load_checkpoint(options['checkpoint'])
+        importer = importing.Importer(
+            batch_size=options['batch_size'],
+            progress=self._progress,
+        )
+        importer.restore_touched(touched)
+        for path in options['paths']:
+            self._import_file(importer, path, options, positions)
+        self.stdout.write(self.style.SUCCESS(
+            'Записано %s строк, %.0f строк/с.' % (
+                importer.total, importer.rate
+            )
+        ))
+        for kind in importing.KINDS:
+            if importer.imported[kind] or importer.skipped[kind]:
+                self.stdout.write('  %s: %s, пропущено %s' % (
+                    kind, importer.imported[kind], importer.skipped[kind]
+                ))
+        if not options['skip_side_effects']:
+            importing.apply_side_effects(importer, log=self.stdout.write)
+            importer.restore_touched({})
+            self._save_checkpoint(options['checkpoint'], positions, {})
+
+    def _import_file(self, importer, path, options, positions):
+        key = os.path.abspath(path)
+        done = positions.get(key, 0)
+        if done:
+            self.stdout.write('%s: пропускаю %s записей.' % (path, done))
+        records = importing.read_records(
+            path, options['format'], options['kind']
+        )
+        position = 0
+        try:
+            for position, (kind, record) in enumerate(records, 1):
+                if position <= done:
+                    continue
+                if importer.add(kind, record):
+                    importer.flush()
+                    # Позиция сохраняется только после фиксации пачки.
+                    positions[key] = position
+                    self._save_checkpoint(
+                        options['checkpoint'], positions,
+                        importer.touched_ids()
+                    )
+        except (OSError, importing.RecordError) as error:
+            raise CommandError(error)
+        importer.flush()
+        positions[key] = max(position, done)
+        self._save_checkpoint(
+            options['checkpoint'], positions, importer.touched_ids()
+        )
+
+    def _progress(self, kind, count, rate):
+        self.stdout.write('%s: %s, %.0f строк/с' % (kind, count, rate))
+
+    @staticmethod
+    def _load_checkpoint(path):
+        """Позиции в файлах и id, для которых не пересчитаны производные."""
+        if not path or not os.path.exists(path):
+            return {}, {}
+        with open(path, encoding='utf-8') as file:
+            checkpoint = json.load(file)
+        if 'positions' not in checkpoint:
+            # Прежний формат: только позиции.
+            return checkpoint, {}
+        return checkpoint['positions'], checkpoint.get('touched', {})
+
+    @staticmethod
+    def _save_checkpoint(path, positions, touched):
+        if not path:
+            return
+        # Сначала во временный файл: оборванная запись не портит позиции.
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump({'positions': positions, 'touched': touched}, file)
+        os.replace(temporary, path)
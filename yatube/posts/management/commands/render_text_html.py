@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Comment, Post, render_text
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет готовый HTML текста (text_html) у постов и комментариев, '
+        'сохранённых до его появления.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать и уже заполненные строки.'
+        )
+
+    def handle(self, *args, **options):
+        for model in (Post, Comment):
+            rendered = self._render(
+                model, options['batch_size'], options['all']
+            )
+            self.stdout.write('%s: обновлено %s.' % (
+                model.__name__, rendered
+            ))
+        self.stdout.write(self.style.SUCCESS('HTML текстов заполнен.'))
+
+    @staticmethod
+    def _render(model, batch_size, everything):
+        """Проходит таблицу пачками по возрастанию pk; каждая — транзакция."""
+        queryset = model.objects.order_by('pk').only('pk', 'text')
+        if not everything:
+            queryset = queryset.filter(text_html='').exclude(text='')
+        rendered = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return rendered
+            for obj in batch:
+                obj.text_html = render_text(obj.text)
+            with transaction.atomic():
+                model.objects.bulk_update(batch, ['text_html'])
+            rendered += len(batch)
+            last_pk = batch[-1].pk
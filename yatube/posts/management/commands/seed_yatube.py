@@ -0,0 +1,67 @@
+import itertools
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from posts import importing
+from posts.models import Post
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками со степенным распределением.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--follows-per-user', type=int, default=20)
+        parser.add_argument('--comments-per-post', type=int, default=3)
+        parser.add_argument(
+            '--images', type=int, default=0,
+            help='Сколько постов получат крошечные картинки.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='При одном seed данные одинаковые.'
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.2,
+            help='Показатель степенного закона популярности авторов.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--skip-side-effects', action='store_true')
+
+    def handle(self, *args, **options):
+        seeder = Seeder(seed=options['seed'], alpha=options['alpha'])
+        first_id = (Post.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        importer = importing.Importer(
+            batch_size=options['batch_size'],
+            progress=self._progress,
+        )
+        # Генераторы ленивые: следующий берёт имена из предыдущего,
+        # поэтому порядок цепочки важен.
+        records = itertools.chain(
+            seeder.users(options['users']),
+            seeder.groups(options['groups']),
+            seeder.posts(options['posts'], first_id, options['images']),
+            seeder.comments(options['comments_per_post']),
+            seeder.follows(options['follows_per_user']),
+        )
+        for kind, record in records:
+            if importer.add(kind, record):
+                importer.flush()
+        importer.flush()
+        self.stdout.write(self.style.SUCCESS(
+            'Записано %s строк, %.0f строк/с.' % (
+                importer.total, importer.rate
+            )
+        ))
+        if not options['skip_side_effects']:
+            importing.apply_side_effects(importer, log=self.stdout.write)
+
+    def _progress(self, kind, count, rate):
+        self.stdout.write('%s: %s, %.0f строк/с' % (kind, count, rate))
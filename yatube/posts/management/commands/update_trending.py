@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинги популярных постов и групп; '
+        'с --interval делает это постоянно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять каждые столько секунд, пока не прервут.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            posts, groups = trending.rebuild()
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                'В рейтинге %s постов и %s групп, пересчёт за %.2f с.' % (
+                    posts, groups, elapsed
+                )
+            )
+            if not options['interval']:
+                return
+            time.sleep(max(options['interval'] - elapsed, 0))
@@ -0,0 +1,105 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:22
+
+import re
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+import django.db.models.deletion
+import posts.models
+
+FTS_TABLE = 'posts_search'
+TEXT_WEIGHT = 3
+COMMENTS_WEIGHT = 1
+
+
+def create_fts_index(apps, schema_editor):
+    """Таблица FTS5 с текстами постов и комментариев, если FTS5 есть."""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE %s USING fts5(text, comments, "
+                "tokenize = 'unicode61')" % FTS_TABLE
+            )
+        except OperationalError:
+            # SQLite собран без FTS5: поиск пойдёт по SearchTerm.
+            return
+        cursor.execute(
+            'INSERT INTO %s (rowid, text, comments) '
+            'SELECT post.id, post.text, COALESCE(('
+            " SELECT group_concat(comment.text, ' ') FROM posts_comment"
+            ' AS comment WHERE comment.post_id = post.id'
+            "), '') FROM posts_post AS post" % FTS_TABLE
+        )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS %s' % FTS_TABLE)
+
+
+def fill_search_terms(apps, schema_editor):
+    tables = schema_editor.connection.introspection.table_names()
+    if FTS_TABLE in tables:
+        return
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    SearchTerm = apps.get_model('posts', 'SearchTerm')
+
+    def tokenize(text):
+        return [word[:64] for word in re.findall(r'[^\W_]+', text.lower())]
+
+    for post in Post.objects.iterator():
+        weights = Counter()
+        for term in tokenize(post.text):
+            weights[term] += TEXT_WEIGHT
+        for text in Comment.objects.filter(post=post).values_list(
+                'text', flat=True):
+            for term in tokenize(text):
+                weights[term] += COMMENTS_WEIGHT
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term, post_id=post.pk, weight=weight)
+            for term, weight in weights.items()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='слово')),
+                ('weight', models.PositiveIntegerField(verbose_name='вес')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'post'), name='unique_search_term'),
+        ),
+        migrations.CreateModel(
+            name='PostSearch',
+            fields=[
+                ('post', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='posts.Post')),
+                ('text', models.TextField()),
+                ('comments', models.TextField()),
+                ('document', posts.models.SearchDocumentField(db_column='posts_search')),
+            ],
+            options={
+                'db_table': 'posts_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+        migrations.RunPython(fill_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingPost',
+            fields=[
+                ('rank', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='место')),
+                ('score', models.FloatField(verbose_name='популярность')),
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trending', to='posts.Post')),
+            ],
+            options={
+                'ordering': ('rank',),
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendingGroup',
+            fields=[
+                ('rank', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='место')),
+                ('score', models.FloatField(verbose_name='популярность')),
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trending', to='posts.Group')),
+            ],
+            options={
+                'ordering': ('rank',),
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:05
+
+from django.db import migrations, models
+import posts.models
+
+FTS_TABLE = 'posts_search'
+# Строки поста: rowid от post_id << 32 до (post_id + 1) << 32.
+POST_ROWS = 1 << 32
+
+
+def split_comment_rows(apps, schema_editor):
+    """Комментарии переезжают из строки поста в собственные строки."""
+    connection = schema_editor.connection
+    if FTS_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        cursor.execute(
+            'INSERT INTO %s (rowid, text, comments) '
+            "SELECT id * %%s, text, '' FROM posts_post" % FTS_TABLE,
+            [POST_ROWS]
+        )
+        cursor.execute(
+            'INSERT INTO %s (rowid, text, comments) '
+            "SELECT post_id * %%s + id, '', text FROM posts_comment "
+            'WHERE post_id IS NOT NULL' % FTS_TABLE,
+            [POST_ROWS]
+        )
+
+
+def join_comment_rows(apps, schema_editor):
+    connection = schema_editor.connection
+    if FTS_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        cursor.execute(
+            'INSERT INTO %s (rowid, text, comments) '
+            'SELECT post.id, post.text, COALESCE(('
+            " SELECT group_concat(comment.text, char(10))"
+            ' FROM posts_comment AS comment'
+            ' WHERE comment.post_id = post.id'
+            "), '') FROM posts_post AS post" % FTS_TABLE
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_pub_date_index'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='PostSearch',
+        ),
+        migrations.CreateModel(
+            name='PostSearch',
+            fields=[
+                ('id', models.BigIntegerField(db_column='rowid', primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('comments', models.TextField()),
+                ('document', posts.models.SearchDocumentField(db_column='posts_search')),
+                ('rank', posts.models.SearchRankField()),
+            ],
+            options={
+                'db_table': 'posts_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(split_comment_rows, join_comment_rows),
+    ]
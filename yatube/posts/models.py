@@ -1,23 +1,52 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.template.defaultfilters import linebreaksbr
+from django.utils.safestring import mark_safe
 
 from core.models import CreatedModel
 
 User = get_user_model()
 
 
+def render_text(text):
+    """HTML текста: экранирование и переносы строк, как у linebreaksbr."""
+    return str(linebreaksbr(text, autoescape=True))
+
+
+class RenderedTextMixin:
+    """
+    Хранит рядом с text готовый HTML в text_html: он считается при
+    сохранении, и шаблоны не прогоняют текст через фильтры на каждом
+    показе.
+    """
+
+    def save(self, *args, **kwargs):
+        self.text_html = render_text(self.text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'text' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'text_html'}
+        super().save(*args, **kwargs)
+
+    @property
+    def html(self):
+        """Готовый HTML; для строк, которые ещё не заполнены, — на лету."""
+        return mark_safe(self.text_html or render_text(self.text))
+
+
 class Group(models.Model):
     title = models.CharField('название группы', max_length=200)
     slug = models.SlugField('уникальный адрес', max_length=50, unique=True)
     description = models.TextField('описание группы')
+    posts_count = models.PositiveIntegerField('число постов', default=0)
 
     def __str__(self):
         title = self.title
         return title[:15]
 
 
-class Post(CreatedModel):
+class Post(RenderedTextMixin, CreatedModel):
     text = models.TextField('содержание поста')
+    text_html = models.TextField('HTML поста', blank=True, editable=False)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -38,11 +67,33 @@ class Post(CreatedModel):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'число комментариев',
+        default=0
+    )
+    # Версия карточки поста в кэше: сдвигается при любой правке,
+    # а также когда меняются группа, имя автора или варианты картинки.
+    updated_at = models.DateTimeField('дата изменения', auto_now=True)
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            # Общая лента: страница по курсору и MAX(pub_date) для ETag.
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         text = self.text
@@ -51,8 +102,13 @@ class Post(CreatedModel):
         return text[:15] + " ; " + str(author) + " ; " + str(group)
 
 
-class Comment(CreatedModel):
+class Comment(RenderedTextMixin, CreatedModel):
     text = models.TextField('содержание комментария')
+    text_html = models.TextField(
+        'HTML комментария',
+        blank=True,
+        editable=False
+    )
     post = models.ForeignKey(
         Post,
         null=True,
@@ -68,6 +124,14 @@ class Comment(CreatedModel):
         verbose_name='Автор'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date'],
+                name='comment_post_pub_date_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -83,7 +147,181 @@ class Follow(models.Model):
         related_name='following'
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'
+            ),
+        ]
+
     def __str__(self):
         user = self.user
         author = self.author
         return str(user) + " ; " + str(author)
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые дорого считать при каждом показе."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField('число подписок', default=0)
+
+    def __str__(self):
+        return str(self.user)
+
+
+class TimelineEntry(models.Model):
+    """
+    Материализованная лента подписок: пост в ленте конкретного читателя.
+    Дата публикации продублирована, чтобы страница ленты читалась
+    одним диапазоном по индексу (user, -pub_date).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-id'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.user) + " ; " + str(self.post_id)
+
+
+class TrendingPost(models.Model):
+    """
+    Рейтинг популярных постов, который пересчитывает posts.trending.
+    Место в рейтинге — первичный ключ: вкладка «Популярное» читает
+    диапазон по нему.
+    """
+    rank = models.PositiveIntegerField('место', primary_key=True)
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='trending'
+    )
+    score = models.FloatField('популярность')
+
+    class Meta:
+        ordering = ('rank',)
+
+    def __str__(self):
+        return str(self.rank) + " ; " + str(self.post_id)
+
+
+class TrendingGroup(models.Model):
+    """Рейтинг популярных групп: сумма популярности их постов."""
+    rank = models.PositiveIntegerField('место', primary_key=True)
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='trending'
+    )
+    score = models.FloatField('популярность')
+
+    class Meta:
+        ordering = ('rank',)
+
+    def __str__(self):
+        return str(self.rank) + " ; " + str(self.group_id)
+
+
+class SearchTerm(models.Model):
+    """
+    Обратный индекс для поиска по постам там, где нет SQLite FTS5:
+    слово и вес его вхождений в текст поста и комментарии к нему.
+    """
+    term = models.CharField('слово', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_terms'
+    )
+    weight = models.PositiveIntegerField('вес')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'post'],
+                name='unique_search_term'
+            ),
+        ]
+
+    def __str__(self):
+        return self.term + " ; " + str(self.post_id)
+
+
+class Match(models.Lookup):
+    """Условие MATCH полнотекстового поиска SQLite FTS5."""
+    lookup_name = 'match'
+    # Справа строка запроса, а не значение столбца (у rank — число).
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '%s MATCH %s' % (lhs, rhs), lhs_params + rhs_params
+
+
+class SearchDocumentField(models.TextField):
+    """Скрытый столбец таблицы FTS5 с её именем: весь документ сразу."""
+
+
+class SearchRankField(models.FloatField):
+    """
+    Скрытый столбец rank таблицы FTS5. Условие rank MATCH задаёт
+    функцию ранжирования на время запроса.
+    """
+
+
+SearchDocumentField.register_lookup(Match)
+SearchRankField.register_lookup(Match)
+
+
+class PostSearch(models.Model):
+    """
+    Таблица SQLite FTS5: строка с текстом поста и по строке на каждый
+    комментарий к нему. Строки поста занимают свой диапазон rowid
+    (см. posts.search), так что комментарий пишется и удаляется, не
+    трогая остальных строк поста. Создаётся миграцией, если SQLite собран
+    с FTS5, и пишется только из posts.search; модель нужна, чтобы искать
+    и ранжировать ORM.
+    """
+    id = models.BigIntegerField(primary_key=True, db_column='rowid')
+    text = models.TextField()
+    comments = models.TextField()
+    document = SearchDocumentField(db_column='posts_search')
+    rank = SearchRankField()
+
+    class Meta:
+        managed = False
+        db_table = 'posts_search'
@@ -0,0 +1,303 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+from core import routers
+
+from . import caching
+
+FEED_ORDERING = ('-pub_date', '-id')
+COUNT_PREFIX = 'page_count:'
+# Комментарии читаются от старых к новым.
+COMMENTS_ORDERING = ('pub_date', 'id')
+
+
+def encode_cursor(values):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+    raw = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен; для испорченного токена возвращает None."""
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding)
+        values = json.loads(raw.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+class CursorPaginator(Paginator):
+    """
+    Постраничный вывод по ключу сортировки (keyset pagination).
+    Не выполняет COUNT(*) и OFFSET: каждая страница — это диапазонное
+    чтение по индексу начиная с позиции, закодированной в курсоре.
+    Общее число страниц неизвестно, поэтому номер страницы условный:
+    1 — начало ленты, 2 — середина; num_pages на единицу больше номера,
+    если дальше есть записи. Этого хватает стандартным has_next()
+    и has_previous() у Page.
+    """
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING):
+        super().__init__(object_list.order_by(*ordering), per_page)
+        self.ordering = ordering
+
+    @property
+    def fields(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    def _parse(self, token):
+        values = decode_cursor(token) if token else None
+        if values is None or len(values) != len(self.ordering):
+            return None
+        try:
+            return [
+                self._to_python(name, value)
+                for name, value in zip(self.fields, values)
+            ]
+        except ValidationError:
+            return None
+
+    def _to_python(self, name, value):
+        try:
+            field = self.object_list.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Аннотация, например ранг результата поиска.
+            if not isinstance(value, (int, float)):
+                raise ValidationError('Неверное значение курсора.')
+            return value
+        return field.to_python(value)
+
+    def _keyset_filter(self, values, forward):
+        """Условие «строго после values» в заданном направлении обхода."""
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            field = name.lstrip('-')
+            equal = {
+                prev: values[pos]
+                for pos, prev in enumerate(self.fields[:index])
+            }
+            equal['%s__%s' % (field, lookup)] = values[index]
+            condition |= Q(**equal)
+        return condition
+
+    def _cursor_for(self, obj):
+        return encode_cursor([getattr(obj, name) for name in self.fields])
+
+    def get_cursor_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед before."""
+        after_values = self._parse(after)
+        before_values = None if after_values else self._parse(before)
+        queryset = self.object_list
+        if before_values is not None:
+            reverse_ordering = [
+                name[1:] if name.startswith('-') else '-' + name
+                for name in self.ordering
+            ]
+            queryset = queryset.filter(
+                self._keyset_filter(before_values, forward=False)
+            ).order_by(*reverse_ordering)
+        elif after_values is not None:
+            queryset = queryset.filter(
+                self._keyset_filter(after_values, forward=True)
+            )
+        items = list(queryset[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if before_values is not None:
+            items.reverse()
+            has_newer, has_older = has_more, True
+        else:
+            has_newer, has_older = after_values is not None, has_more
+        has_newer = bool(items) and has_newer
+        has_older = bool(items) and has_older
+        number = 2 if has_newer else 1
+        self.num_pages = number + 1 if has_older else number
+        page = self._get_page(items, number, self)
+        page.is_cursor = True
+        page.next_cursor = self._cursor_for(items[-1]) if has_older else ''
+        page.previous_cursor = (
+            self._cursor_for(items[0]) if has_newer else ''
+        )
+        return page
+
+
+def estimated_count(queryset):
+    """
+    Примерное число строк всей таблицы из статистики SQLite
+    (sqlite_stat1, её собирает ANALYZE). Для выборки с условиями,
+    списка и базы без статистики — None.
+    """
+    if not isinstance(queryset, QuerySet) or queryset.query.where:
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 WHERE tbl = %s',
+                [queryset.model._meta.db_table]
+            )
+            rows = cursor.fetchall()
+    except DatabaseError:
+        # ANALYZE ещё не запускали.
+        return None
+    # Первое число каждой строки — строки таблицы или её индекса.
+    counts = [int(stat.split()[0]) for stat, in rows if stat]
+    return max(counts) if counts else None
+
+
+class WindowedPage(Page):
+    @property
+    def window(self):
+        if not self.paginator.estimated:
+            return self.paginator.window(self.number)
+        # По оценке нельзя знать, какие страницы дальше существуют:
+        # вперёд ведёт только «Следующая».
+        window = self.paginator.window(self.number, last=self.number)
+        if self.has_next():
+            window.append(self.paginator.ELLIPSIS)
+        return window
+
+    def has_next(self):
+        if self.paginator.estimated:
+            return len(self) == self.paginator.per_page
+        return super().has_next()
+
+
+class WindowedPaginator(Paginator):
+    """
+    Постраничный вывод ?page=N для длинных лент.
+
+    Ссылки на страницы выводятся окном вокруг текущей (window()),
+    а не все подряд. Число записей кэшируется по областям scopes
+    (posts.caching) и сбрасывается вместе с их поколениями, то есть
+    при публикации, правке и удалении постов; считается оно всегда
+    по основной базе, даже во вьюхах, читающих с реплики. Если
+    выборка — вся таблица и по статистике SQLite в ней не меньше
+    PAGINATOR_ESTIMATE_THRESHOLD строк, COUNT(*) не выполняется:
+    берётся оценка, и estimated становится True. Тогда последняя
+    страница неизвестна: окно кончается на текущей, а дальше
+    страница есть, если текущая заполнена целиком.
+    """
+    ELLIPSIS = None
+
+    def __init__(self, object_list, per_page, scopes=(), **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.scopes = list(scopes)
+        self.estimated = False
+
+    def _count(self):
+        estimate = estimated_count(self.object_list)
+        if (estimate is not None
+                and estimate >= settings.PAGINATOR_ESTIMATE_THRESHOLD):
+            return estimate, True
+        return super().count, False
+
+    @cached_property
+    def count(self):
+        if not self.scopes:
+            count, self.estimated = self._count()
+            return count
+        key = COUNT_PREFIX + ':'.join(
+            self.scopes + list(map(str, caching.generations(*self.scopes)))
+        )
+        found = cache.get(key)
+        if found is None:
+            # Запись живёт до следующего поколения областей, а реплика
+            # может отставать от него: число считается по основной базе.
+            with routers.primary():
+                found = self._count()
+            cache.set(key, found, settings.FEED_CACHE_TIMEOUT)
+        count, self.estimated = found
+        return count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Оценка могла оказаться меньше настоящего числа записей:
+            # страницы за оценённой последней тоже открываются.
+            if self.estimated and int(number) > 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        if not self.estimated:
+            return super().page(number)
+        # Последняя страница по оценке может быть неполной или не
+        # последней, поэтому срез не обрезается по count.
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+    def window(self, number, last=None):
+        """
+        Номера страниц для ссылок: PAGINATOR_ON_EACH_SIDE вокруг
+        текущей и PAGINATOR_ON_ENDS с краёв, но не дальше last;
+        пропуски — ELLIPSIS.
+        """
+        on_each_side = settings.PAGINATOR_ON_EACH_SIDE
+        on_ends = settings.PAGINATOR_ON_ENDS
+        last = last or self.num_pages
+        shown = sorted({
+            page for page in (
+                list(range(1, on_ends + 1))
+                + list(range(number - on_each_side, number + on_each_side + 1))
+                + list(range(last - on_ends + 1, last + 1))
+            )
+            if 1 <= page <= last
+        })
+        window = []
+        for page in shown:
+            if window and page - window[-1] > 1:
+                window.append(self.ELLIPSIS)
+            window.append(page)
+        return window
+
+    def _get_page(self, *args, **kwargs):
+        return WindowedPage(*args, **kwargs)
+
+
+def get_page(request, queryset, per_page=settings.NUMBER_TEN, scopes=()):
+    """
+    Страница ленты по параметрам запроса.
+    Старые ссылки вида ?page=N обслуживаются WindowedPaginator,
+    всё остальное — курсорами ?after= / ?before=. scopes — области
+    кэша, по которым кэшируется число записей ленты.
+    """
+    if 'page' in request.GET:
+        paginator = WindowedPaginator(
+            queryset.order_by(*FEED_ORDERING), per_page, scopes
+        )
+        return paginator.get_page(request.GET.get('page'))
+    paginator = CursorPaginator(queryset, per_page)
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+def get_comments_page(request, comments, per_page=None):
+    """Пачка комментариев; следующая — по курсору ?after=."""
+    paginator = CursorPaginator(
+        comments,
+        per_page or settings.COMMENTS_PER_PAGE,
+        ordering=COMMENTS_ORDERING
+    )
+    return paginator.get_cursor_page(after=request.GET.get('after'))
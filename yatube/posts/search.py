@@ -0,0 +1,312 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import (Case, Count, ExpressionWrapper, F, FloatField,
+                              IntegerField, OuterRef, Subquery, Sum, Value,
+                              When)
+
+from .models import Comment, Post, PostSearch, SearchTerm
+from .paginators import CursorPaginator
+
+# Таблица SQLite FTS5, которую создаёт миграция 0011_search.
+FTS_TABLE = PostSearch._meta.db_table
+# Слово в тексте поста весит больше, чем в комментарии к нему.
+TEXT_WEIGHT = 3
+COMMENTS_WEIGHT = 1
+# Строки поста в FTS5 занимают rowid от post_id << 32 до
+# (post_id + 1) << 32: текст поста — первая строка диапазона, комментарий —
+# post_id << 32 | comment_id. Так комментарий пишется отдельной строкой,
+# а строки поста выбираются по диапазону rowid.
+POST_ROWS = 1 << 32
+INSERT_ROW = (
+    'INSERT OR REPLACE INTO %s (rowid, text, comments) '
+    'VALUES (%%s, %%s, %%s)' % FTS_TABLE
+)
+DELETE_POST_ROWS = 'DELETE FROM %s WHERE rowid >= %%s AND rowid < %%s' % (
+    FTS_TABLE
+)
+RANKING = ('-rank', '-id')
+BATCH_SIZE = 500
+
+WORD_RE = re.compile(r'[^\W_]+')
+TERM_LENGTH = SearchTerm._meta.get_field('term').max_length
+
+_uses_fts = None
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре — так же делит текст FTS5."""
+    return [word[:TERM_LENGTH] for word in WORD_RE.findall(text.lower())]
+
+
+def uses_fts():
+    """Есть ли в базе таблица FTS5; иначе поиск идёт по SearchTerm."""
+    global _uses_fts
+    if _uses_fts is None:
+        _uses_fts = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _uses_fts
+
+
+# Индексация
+
+def _documents(post_ids):
+    """Тексты постов и комментариев к ним: {id: (текст, [(id, текст)])}."""
+    texts = dict(
+        Post.objects.filter(pk__in=post_ids).values_list('pk', 'text')
+    )
+    comments = {}
+    for post_id, pk, text in Comment.objects.filter(
+            post_id__in=list(texts)).order_by('pk').values_list(
+            'post_id', 'pk', 'text').iterator():
+        comments.setdefault(post_id, []).append((pk, text))
+    return {
+        pk: (text, comments.get(pk, []))
+        for pk, text in texts.items()
+    }
+
+
+def _search_terms(documents):
+    for post_id, (text, comments) in documents.items():
+        weights = Counter()
+        for term in tokenize(text):
+            weights[term] += TEXT_WEIGHT
+        for _, comment in comments:
+            for term in tokenize(comment):
+                weights[term] += COMMENTS_WEIGHT
+        for term, weight in weights.items():
+            yield SearchTerm(term=term, post_id=post_id, weight=weight)
+
+
+def _row_id(post_id, comment_id=0):
+    return post_id * POST_ROWS + comment_id
+
+
+def _fts_rows(documents):
+    for pk, (text, comments) in documents.items():
+        yield _row_id(pk), text, ''
+        for comment_id, comment in comments:
+            yield _row_id(pk, comment_id), '', comment
+
+
+def _delete_fts_rows(post_ids):
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            DELETE_POST_ROWS,
+            [(_row_id(pk), _row_id(pk + 1)) for pk in post_ids]
+        )
+
+
+def index_posts(post_ids):
+    """Заново индексирует посты вместе с комментариями к ним."""
+    post_ids = list(post_ids)
+    documents = _documents(post_ids)
+    if not uses_fts():
+        SearchTerm.objects.filter(post_id__in=post_ids).delete()
+        SearchTerm.objects.bulk_create(
+            _search_terms(documents),
+            batch_size=BATCH_SIZE
+        )
+        return
+    _delete_fts_rows(post_ids)
+    # INSERT через ORM задел бы скрытые столбцы document и rank.
+    with connection.cursor() as cursor:
+        cursor.executemany(INSERT_ROW, list(_fts_rows(documents)))
+
+
+def index_comment(comment, created=True):
+    """
+    Пишет в индекс комментарий, не перечитывая пост
+    и остальные комментарии к нему.
+    """
+    if uses_fts():
+        # Строка комментария своя: правка заменяет только её.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                INSERT_ROW,
+                [_row_id(comment.post_id, comment.pk), '', comment.text]
+            )
+        return
+    if not created:
+        # Прежний текст из весов слов не вычесть.
+        index_posts([comment.post_id])
+        return
+    counts = Counter(tokenize(comment.text))
+    terms = SearchTerm.objects.filter(post_id=comment.post_id)
+    existing = set(
+        terms.filter(term__in=list(counts)).values_list('term', flat=True)
+    )
+    by_count = {}
+    for term in existing:
+        by_count.setdefault(counts[term], []).append(term)
+    for count, group in by_count.items():
+        terms.filter(term__in=group).update(
+            weight=F('weight') + count * COMMENTS_WEIGHT
+        )
+    SearchTerm.objects.bulk_create(
+        [
+            SearchTerm(
+                term=term,
+                post_id=comment.post_id,
+                weight=count * COMMENTS_WEIGHT
+            )
+            for term, count in counts.items() if term not in existing
+        ],
+        batch_size=BATCH_SIZE
+    )
+
+
+def unindex_comment(comment):
+    """Убирает из индекса удалённый комментарий."""
+    if not uses_fts():
+        index_posts([comment.post_id])
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE,
+            [_row_id(comment.post_id, comment.pk)]
+        )
+
+
+def unindex_posts(post_ids):
+    """Убирает удалённые посты из индекса."""
+    # Строки SearchTerm удаляются каскадом вместе с постом.
+    if uses_fts():
+        _delete_fts_rows(post_ids)
+
+
+def rebuild():
+    """Строит индекс заново по всем постам."""
+    if uses_fts():
+        PostSearch.objects.all().delete()
+    else:
+        SearchTerm.objects.all().delete()
+    post_ids = Post.objects.order_by('pk').values_list('pk', flat=True)
+    batch = []
+    for pk in post_ids.iterator():
+        batch.append(pk)
+        if len(batch) == BATCH_SIZE:
+            index_posts(batch)
+            batch = []
+    if batch:
+        index_posts(batch)
+
+
+# Поиск
+
+def _query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def _fts_match(terms):
+    # Слова берутся в кавычки: синтаксис запросов FTS5 посетителю
+    # недоступен, а все слова запроса обязательны.
+    return ' '.join('"%s"' % term for term in terms)
+
+
+def _fts_post_id():
+    return ExpressionWrapper(F('pk') / POST_ROWS, output_field=IntegerField())
+
+
+def _fts_posts(terms):
+    # Слово может быть и в тексте, и в любом из комментариев: каждое
+    # слово ищется по всем строкам поста отдельно.
+    posts = Post.objects.all()
+    for term in terms:
+        posts = posts.filter(pk__in=PostSearch.objects.filter(
+            document__match=_fts_match([term])
+        ).annotate(post_id=_fts_post_id()).values('post_id'))
+    return posts
+
+
+def _fts_rank(terms):
+    """Сумма bm25() строк поста с обратным знаком: больше — лучше."""
+    rows = PostSearch.objects.filter(
+        document__match=' OR '.join(_fts_match([term]) for term in terms),
+        rank__match='bm25(%s, %s)' % (TEXT_WEIGHT, COMMENTS_WEIGHT),
+        pk__gte=OuterRef('pk') * POST_ROWS,
+        pk__lt=(OuterRef('pk') + 1) * POST_ROWS,
+    )
+    return Subquery(
+        rows.order_by().annotate(post_id=_fts_post_id()).values(
+            'post_id'
+        ).annotate(score=Sum(
+            F('rank') * Value(-1), output_field=FloatField()
+        )).values('score'),
+        output_field=FloatField()
+    )
+
+
+def _term_posts(terms):
+    posts = Post.objects.all()
+    for term in terms:
+        posts = posts.filter(
+            pk__in=SearchTerm.objects.filter(term=term).values('post_id')
+        )
+    return posts
+
+
+def _term_rank(terms):
+    """Сумма весов слов поста, умноженных на их редкость (idf)."""
+    total = Post.objects.count()
+    frequencies = dict(
+        SearchTerm.objects.filter(term__in=terms).values('term').annotate(
+            frequency=Count('pk')
+        ).values_list('term', 'frequency')
+    )
+    score = Sum(Case(
+        *[When(term=term, then=ExpressionWrapper(
+            F('weight') * Value(
+                math.log(1 + total / frequencies.get(term, 1))
+            ),
+            output_field=FloatField()
+        )) for term in terms],
+        output_field=FloatField()
+    ))
+    return Subquery(
+        SearchTerm.objects.filter(
+            post=OuterRef('pk'),
+            term__in=terms
+        ).order_by().values('post').annotate(score=score).values('score'),
+        output_field=FloatField()
+    )
+
+
+def matching(query):
+    """Посты, в тексте или комментариях которых есть все слова запроса."""
+    terms = _query_terms(query)
+    if not terms:
+        return Post.objects.none()
+    if uses_fts():
+        return _fts_posts(terms)
+    return _term_posts(terms)
+
+
+def search(query):
+    """
+    Найденные посты с рангом rank: чем он больше, тем лучше пост
+    подходит к запросу.
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return Post.objects.none().annotate(
+            rank=Value(0.0, output_field=FloatField())
+        )
+    if uses_fts():
+        return _fts_posts(terms).annotate(rank=_fts_rank(terms))
+    return _term_posts(terms).annotate(rank=_term_rank(terms))
+
+
+def get_search_page(request, query, per_page=settings.NUMBER_TEN):
+    """Страница результатов поиска по курсорам ?after= / ?before=."""
+    posts = search(query).select_related('author', 'group')
+    paginator = CursorPaginator(posts, per_page, ordering=RANKING)
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
@@ -0,0 +1,131 @@
+"""
+Синтетические данные для проверки Yatube на объёмах, близких к боевым.
+
+Генераторы выдают записи в том же виде, что читает import_yatube,
+поэтому пишутся они тем же Importer: пачками bulk_create с пересчётом
+счётчиков, лент и индекса в конце. Популярность авторов распределена
+по степенному закону: немногие пишут большую часть постов и собирают
+большую часть подписчиков, как в живом сообществе. При одном и том же
+seed данные получаются одинаковыми.
+"""
+import io
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+# Отсчёт дат фиксирован, чтобы данные не зависели от дня запуска.
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+PERIOD = timedelta(days=365)
+IMAGE_SIZE = (64, 48)
+
+
+class Seeder:
+    def __init__(self, seed=0, alpha=1.2, locale='ru_RU'):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.faker = Faker(locale)
+        self.faker.seed_instance(seed)
+        self.alpha = alpha
+        self.usernames = []
+        self.slugs = []
+        self.post_ids = range(0)
+
+    def _popularity(self, count):
+        """Накопленные веса Ципфа: i-й по популярности весит 1/i^alpha."""
+        return list(itertools.accumulate(
+            1 / rank ** self.alpha for rank in range(1, count + 1)
+        ))
+
+    def _date(self):
+        return (EPOCH + self.random.random() * PERIOD).isoformat()
+
+    def users(self, count):
+        self.usernames = [
+            '%s_%s' % (self.faker.user_name(), number)
+            for number in range(count)
+        ]
+        for username in self.usernames:
+            yield 'user', {
+                'username': username,
+                'first_name': self.faker.first_name(),
+                'last_name': self.faker.last_name(),
+            }
+
+    def groups(self, count):
+        self.slugs = ['seed-%s-%s' % (self.seed, number)
+                      for number in range(count)]
+        for slug in self.slugs:
+            yield 'group', {
+                'slug': slug,
+                'title': self.faker.catch_phrase()[:200],
+                'description': self.faker.paragraph(),
+            }
+
+    def image(self, number):
+        """Крошечная картинка через Pillow: путь к ней в хранилище."""
+        color = tuple(self.random.randrange(256) for _ in range(3))
+        picture = Image.new('RGB', IMAGE_SIZE, color)
+        picture.putpixel((0, 0), (255 - color[0], 0, 0))
+        buffer = io.BytesIO()
+        picture.save(buffer, 'PNG')
+        name = 'posts/seed_%s_%s.png' % (self.seed, number)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def posts(self, count, first_id, images=0):
+        """Посты с id подряд от first_id; первые images — с картинками."""
+        authors = self._popularity(len(self.usernames))
+        groups = self._popularity(len(self.slugs)) if self.slugs else None
+        self.post_ids = range(first_id, first_id + count)
+        for number, post_id in enumerate(self.post_ids):
+            author, = self.random.choices(self.usernames, cum_weights=authors)
+            group = None
+            if groups and self.random.random() < 0.5:
+                group, = self.random.choices(self.slugs, cum_weights=groups)
+            yield 'post', {
+                'id': post_id,
+                'author': author,
+                'group': group,
+                'text': self.faker.text(max_nb_chars=400),
+                'pub_date': self._date(),
+                'image': self.image(number) if number < images else '',
+            }
+
+    def comments(self, per_post):
+        """В среднем per_post комментариев на пост."""
+        for post_id in self.post_ids:
+            for _ in range(self.random.randint(0, 2 * per_post)):
+                yield 'comment', {
+                    'post': post_id,
+                    'author': self.random.choice(self.usernames),
+                    'text': self.faker.sentence(),
+                    'pub_date': self._date(),
+                }
+
+    def follows(self, per_user):
+        """Каждый читатель подписан на per_user авторов, чаще популярных."""
+        # Своя очередь популярности: самые читаемые авторы — не обязательно
+        # самые плодовитые, иначе лента подписок каждого читателя
+        # состояла бы из всех постов пары графоманов.
+        ranking = list(self.usernames)
+        self.random.shuffle(ranking)
+        weights = self._popularity(len(ranking))
+        per_user = min(per_user, len(self.usernames) - 1)
+        for username in self.usernames:
+            authors = set()
+            # Популярные авторы выпадают часто: тянем, пока не наберём.
+            for _ in range(per_user * 20):
+                if len(authors) == per_user:
+                    break
+                author, = self.random.choices(ranking, cum_weights=weights)
+                if author != username:
+                    authors.add(author)
+            for author in sorted(authors):
+                yield 'follow', {'user': username, 'author': author}
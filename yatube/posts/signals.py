@@ -0,0 +1,251 @@
+import threading
+
+from django.conf import settings
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import caching, counters, follows, search, thumbnails, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+# Поля пользователя, которые выводятся в лентах.
+DISPLAY_FIELDS = ('username', 'first_name', 'last_name')
+
+# Посты, которые удаляет текущее удаление в этом потоке. Их комментарии
+# удаляются каскадом, и пересчитывать, переиндексировать и сбрасывать в
+# кэше сам пост на каждый комментарий незачем: это сделают сигналы поста.
+# Удаление рассылает сначала все pre_delete, потом все post_delete, причём
+# пост может удалиться и раньше, и позже своих комментариев. Поэтому набор
+# не чистится в post_delete поста, а заводится заново первым pre_delete
+# следующего удаления.
+_deleting = threading.local()
+
+
+def _deleting_posts():
+    if getattr(_deleting, 'finished', True):
+        _deleting.post_ids = set()
+        _deleting.finished = False
+    return _deleting.post_ids
+
+
+def _post_is_deleted(comment):
+    _deleting.finished = True
+    return comment.post_id in getattr(_deleting, 'post_ids', ())
+
+
+@receiver(pre_delete, sender=Post)
+def remember_deleted_post(sender, instance, **kwargs):
+    _deleting_posts().add(instance.pk)
+
+
+@receiver(pre_delete, sender=Comment)
+def start_comment_deletion(sender, instance, **kwargs):
+    _deleting_posts()
+
+
+@receiver(post_delete, sender=Post)
+def finish_post_deletion(sender, instance, **kwargs):
+    _deleting.finished = True
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, raw=False, **kwargs):
+    # Для счётчиков групп нужно знать, из какой группы пост ушёл.
+    if instance._state.adding or raw:
+        instance._previous_group_id = None
+        return
+    instance._previous_group_id = Post.objects.filter(
+        pk=instance.pk
+    ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.shift_user(instance.author_id, 'posts_count', 1)
+        counters.shift_group(instance.group_id, 1)
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id != instance.group_id:
+        counters.shift_group(previous_group_id, -1)
+        counters.shift_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.shift_user(instance.author_id, 'posts_count', -1)
+    counters.shift_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.shift_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    if not _post_is_deleted(instance):
+        counters.shift_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.shift_user(instance.user_id, 'following_count', 1)
+        counters.shift_user(instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.shift_user(instance.user_id, 'following_count', -1)
+    counters.shift_user(instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def update_follow_graph(sender, instance, **kwargs):
+    follows.changed(instance.user_id)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.user_id and instance.author_id:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timeline.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def refill_timelines(sender, instance, **kwargs):
+    # Автор только что опустился до предела раскладки. Выше предела
+    # записи в лентах остаются — вместе с подмешиванием они не дают
+    # дублей, а при возврате вниз недостающее добавит fan_out_author.
+    followers = UserStats.objects.filter(
+        user_id=instance.author_id
+    ).values_list('followers_count', flat=True).first()
+    if followers == settings.TIMELINE_FANOUT_LIMIT:
+        timeline.fan_out_author(instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        previous_group_id = getattr(instance, '_previous_group_id', None)
+        caching.bump(*caching.post_scopes(instance, previous_group_id))
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_feeds(sender, instance, **kwargs):
+    caching.bump(*caching.post_scopes(instance))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump(caching.POSTS_SCOPE, caching.group_scope(instance.pk))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def touch_group_posts(sender, instance, raw=False, **kwargs):
+    # Карточки постов выводят название и адрес группы.
+    if not raw:
+        caching.touch_posts(Post.objects.filter(group=instance))
+
+
+@receiver(pre_save, sender=User)
+def remember_display_name(sender, instance, raw=False, update_fields=None,
+                          **kwargs):
+    instance._display_name_changed = False
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not set(update_fields) & set(
+            DISPLAY_FIELDS):
+        # Например, обновление last_login при входе.
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list(
+        *DISPLAY_FIELDS
+    ).first()
+    current = tuple(getattr(instance, field) for field in DISPLAY_FIELDS)
+    instance._display_name_changed = previous != current
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_feeds(sender, instance, **kwargs):
+    if not getattr(instance, '_display_name_changed', False):
+        return
+    caching.touch_posts(Post.objects.filter(author=instance))
+    group_ids = Post.objects.filter(
+        author=instance, group__isnull=False
+    ).values_list('group_id', flat=True).distinct()
+    caching.bump(
+        caching.POSTS_SCOPE,
+        caching.profile_scope(instance.pk),
+        *[caching.group_scope(group_id) for group_id in group_ids]
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump(caching.follow_scope(instance.user_id))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post_page(sender, instance, raw=False, **kwargs):
+    if not raw and not _post_is_deleted(instance):
+        caching.bump(caching.post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Post)
+def generate_thumbnails(sender, instance, raw=False, **kwargs):
+    if not raw:
+        thumbnails.enqueue(instance)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and 'text' not in update_fields:
+        return
+    search.index_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.unindex_posts([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, created, raw=False, **kwargs):
+    # Горячий путь add_comment: только текст этого комментария.
+    if not raw and instance.post_id:
+        search.index_comment(instance, created)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    if instance.post_id and not _post_is_deleted(instance):
+        search.unindex_comment(instance)
@@ -0,0 +1,26 @@
+from django import template
+
+from posts import caching
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts, template_name):
+    """
+    Пары (пост, карточка), каждая карточка из своей записи в кэше:
+    {% post_cards page_obj 'posts/includes/post_card.html' as cards %}.
+    Шаблон карточки видит только post, а не посетителя, — карточка
+    общая для всех; то, что зависит от посетителя, выводится рядом.
+    """
+    card = context.template.engine.get_template(template_name)
+
+    def render(post):
+        with context.push(post=post):
+            return str(card.render(context))
+
+    posts = list(posts)
+    return list(zip(
+        posts,
+        caching.cached_cards(posts, template_name, render)
+    ))
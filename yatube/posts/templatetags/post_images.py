@@ -0,0 +1,46 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from posts import caching, thumbnails
+
+register = template.Library()
+
+# Ширина картинки на странице: колонка в половину контейнера Bootstrap
+# на широких экранах и вся ширина экрана на узких.
+DEFAULT_SIZES = '(min-width: 768px) 50vw, 100vw'
+
+
+def _srcset(variants):
+    return ', '.join(
+        '%s %sw' % (default_storage.url(name), width)
+        for name, width, _ in variants
+    )
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post, sizes=DEFAULT_SIZES):
+    """
+    Разметка <picture> с вариантами картинки поста разной ширины:
+    WebP для браузеров, которые его понимают, и исходный формат
+    для остальных. Пока варианты не готовы, выводится оригинал,
+    а построение ставится в очередь, чтобы не задерживать страницу.
+    """
+    if not post.image:
+        return {}
+    manifest = thumbnails.ready_variants(post.image)
+    if manifest is None:
+        thumbnails.schedule(post.image.name, caching.post_scopes(post))
+        return {'src': post.image.url}
+    *sources, fallback = manifest
+    name, width, height = fallback['variants'][-1]
+    return {
+        'sources': [
+            {'type': source['type'], 'srcset': _srcset(source['variants'])}
+            for source in sources
+        ],
+        'srcset': _srcset(fallback['variants']),
+        'sizes': sizes,
+        'src': default_storage.url(name),
+        'width': width,
+        'height': height,
+    }
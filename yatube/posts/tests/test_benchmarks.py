@@ -0,0 +1,214 @@
+"""
+Замеры задержки вьюх на наборах данных разного размера.
+
+Тяжёлые, поэтому запускаются только по переменной окружения:
+
+    YATUBE_BENCHMARK=1 python manage.py test posts.tests.test_benchmarks
+
+YATUBE_BENCHMARK_SIZES   размеры набора в постах, по умолчанию 1000
+                         (например, 1000,100000,1000000);
+YATUBE_BENCHMARK_RUNS    запросов на вьюху, по умолчанию 30;
+YATUBE_BENCHMARK_REPORT  куда записать отчёт JSON;
+YATUBE_BENCHMARK_LATENCY_BASELINE  задержки этой машины для сравнения,
+                         по умолчанию benchmark_latency.json;
+YATUBE_BENCHMARK_TOLERANCE  допустимый рост p95 против задержек этой
+                         машины, доля, по умолчанию 1.0 (вдвое);
+YATUBE_BENCHMARK_UPDATE_BASELINE=1  записать отчёт как новую базовую
+                         линию вместо сравнения.
+
+Тест падает только из-за числа SQL-запросов: оно не зависит ни от
+машины, ни от размера набора, и его базовая линия (по вьюхе) лежит
+в репозитории и проверяется для каждого размера. Миллисекунды на разных
+машинах несравнимы, поэтому базовая линия задержек хранится локально,
+вне git, а рост p95 только выводится в отчёт.
+"""
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+ENABLED = bool(os.environ.get('YATUBE_BENCHMARK'))
+SIZES = [
+    int(size)
+    for size in os.environ.get('YATUBE_BENCHMARK_SIZES', '1000').split(',')
+]
+RUNS = int(os.environ.get('YATUBE_BENCHMARK_RUNS', 30))
+TOLERANCE = float(os.environ.get('YATUBE_BENCHMARK_TOLERANCE', 1.0))
+REPORT = os.environ.get('YATUBE_BENCHMARK_REPORT', 'benchmark_report.json')
+LATENCY_BASELINE = os.environ.get(
+    'YATUBE_BENCHMARK_LATENCY_BASELINE', 'benchmark_latency.json'
+)
+UPDATE_BASELINE = bool(os.environ.get('YATUBE_BENCHMARK_UPDATE_BASELINE'))
+BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+
+
+def percentiles(samples):
+    """p50, p95 и p99 в миллисекундах."""
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {
+        'p50_ms': round(cuts[49] * 1000, 2),
+        'p95_ms': round(cuts[94] * 1000, 2),
+        'p99_ms': round(cuts[98] * 1000, 2),
+    }
+
+
+def query_regressions(report, baseline):
+    """Вьюхи, которым на каком-либо размере нужно больше SQL-запросов."""
+    found = []
+    for size, views in report.items():
+        for view, result in views.items():
+            limit = baseline.get(view)
+            if limit is not None and result['queries'] > limit:
+                found.append('%s @ %s: %s SQL-запросов > %s' % (
+                    view, size, result['queries'], limit
+                ))
+    return found
+
+
+def latency_regressions(report, baseline, tolerance):
+    """Вьюхи, у которых p95 вырос больше допустимого на этой машине."""
+    found = []
+    for size, views in report.items():
+        for view, result in views.items():
+            base = baseline.get(size, {}).get(view)
+            if base is None:
+                continue
+            limit = base['p95_ms'] * (1 + tolerance)
+            if result['p95_ms'] > limit:
+                found.append('%s @ %s: p95 %.2f мс > %.2f мс' % (
+                    view, size, result['p95_ms'], limit
+                ))
+    return found
+
+
+def load(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save(path, data):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2)
+
+
+@skipUnless(ENABLED, 'замеры запускаются с YATUBE_BENCHMARK=1')
+class ViewBenchmarks(TestCase):
+    def grow(self, size):
+        """Дополняет набор до size постов через seed_yatube."""
+        missing = size - Post.objects.count()
+        if missing <= 0:
+            return
+        call_command(
+            'seed_yatube',
+            '--users', str(max(missing // 20, 50)),
+            '--groups', str(max(missing // 1000, 5)),
+            '--posts', str(missing),
+            '--follows-per-user', '20',
+            '--comments-per-post', '1',
+            '--seed', str(size),
+            '--batch-size', '5000',
+            stdout=StringIO(),
+        )
+
+    def targets(self):
+        """Самые тяжёлые объекты набора: для них и меряем страницы."""
+        author = User.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        reader = User.objects.annotate(
+            total=Count('follower')
+        ).order_by('-total').first()
+        group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        post = Post.objects.order_by('-comments_count', '-pk').first()
+        return author, reader, group, post
+
+    def requests(self):
+        author, reader, group, post = self.targets()
+        self.assertTrue(Follow.objects.filter(user=reader).exists())
+        client = Client()
+        client.force_login(reader)
+        return client, {
+            'index': ('get', reverse('posts:index'), None),
+            'group_posts': ('get', reverse(
+                'posts:group_posts', args=(group.slug,)
+            ), None),
+            'profile': ('get', reverse(
+                'posts:profile', args=(author.username,)
+            ), None),
+            'post_detail': ('get', reverse(
+                'posts:post_detail', args=(post.pk,)
+            ), None),
+            'follow_index': ('get', reverse('posts:follow_index'), None),
+            'post_create': ('post', reverse('posts:post_create'), {
+                'text': 'Замер публикации',
+            }),
+            'add_comment': ('post', reverse(
+                'posts:add_comment', args=(post.pk,)
+            ), {'text': 'Замер комментария'}),
+        }
+
+    def measure(self, client, method, url, data):
+        # Первый запрос греет кэш и шаблоны и в замер не входит.
+        getattr(client, method)(url, data)
+        samples = []
+        for _ in range(RUNS):
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            samples.append(time.perf_counter() - started)
+            self.assertLess(response.status_code, 400, url)
+        with CaptureQueriesContext(connection) as queries:
+            getattr(client, method)(url, data)
+        return {**percentiles(samples), 'queries': len(queries)}
+
+    def test_views(self):
+        report = {}
+        for size in SIZES:
+            self.grow(size)
+            client, requests = self.requests()
+            report[str(size)] = {
+                view: self.measure(client, *request)
+                for view, request in requests.items()
+            }
+        latency = load(LATENCY_BASELINE)
+        slower = latency_regressions(report, latency or {}, TOLERANCE)
+        save(REPORT, {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'runs': RUNS,
+            'results': report,
+            'slower': slower,
+        })
+        for line in slower:
+            sys.stderr.write('Медленнее обычного: %s\n' % line)
+        if UPDATE_BASELINE:
+            save(LATENCY_BASELINE, report)
+            save(BASELINE, {
+                view: max(views[view]['queries'] for views in report.values())
+                for view in requests
+            })
+            return
+        baseline = load(BASELINE)
+        if baseline is not None:
+            found = query_regressions(report, baseline)
+            self.assertFalse(found, '\n'.join(found))
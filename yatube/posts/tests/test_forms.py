@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from ..models import Post, Group, Comment
@@ -50,6 +52,28 @@ class TaskCreateFormTests(TestCase):
         self.assertEqual(last_post.text, form_data['text'])
         self.assertEqual(Post.objects.count(), posts_count + 1)
 
+    def test_form_pages_do_not_open_transactions(self):
+        """Показ формы не берёт блокировку записи SQLite."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        urls = (
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', args=(post.pk,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                # Внутри TestCase транзакция вьюхи — точка сохранения.
+                with CaptureQueriesContext(connection) as queries:
+                    self.authorized_user.get(url)
+                    self.authorized_user.post(url, {'text': ''})
+                self.assertFalse(any(
+                    'SAVEPOINT' in query['sql'] for query in queries
+                ))
+                with CaptureQueriesContext(connection) as queries:
+                    self.authorized_user.post(url, {'text': 'Текст'})
+                self.assertTrue(any(
+                    'SAVEPOINT' in query['sql'] for query in queries
+                ))
+
     def test_change_post(self):
         group = Group.objects.create(
             title='test-title',
@@ -97,3 +121,27 @@ class TaskCreateFormTests(TestCase):
                 post=post
             ).exists()
         )
+
+    def test_comment_fragment_for_scripts(self):
+        """Скрипту страницы add_comment отвечает фрагментом и счётчиком."""
+        post = Post.objects.create(author=self.user, text='test-text')
+        url = reverse('posts:add_comment', kwargs={'post_id': post.pk})
+        response = self.authorized_user.post(
+            url,
+            data={'text': 'ajax-comment'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        comment = Comment.objects.get(text='ajax-comment')
+        self.assertIn(f'id="comment-{comment.pk}"', data['html'])
+        self.assertIn('ajax-comment', data['html'])
+        self.assertEqual(data['comments_count'], 1)
+        response = self.authorized_user.post(
+            url,
+            data={'text': ''},
+            HTTP_ACCEPT='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('text', response.json()['errors'])
+        self.assertEqual(Comment.objects.filter(post=post).count(), 1)
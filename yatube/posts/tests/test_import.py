@@ -0,0 +1,201 @@
+import itertools
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import search
+from ..models import Comment, Follow, Group, Post, TimelineEntry
+from ..seeding import Seeder
+
+User = get_user_model()
+
+RECORDS = [
+    {'type': 'user', 'username': 'leo', 'first_name': 'Лев'},
+    {'type': 'user', 'username': 'anna'},
+    {'type': 'group', 'slug': 'books', 'title': 'Книги'},
+    {'type': 'post', 'id': 501, 'author': 'leo', 'group': 'books',
+     'text': 'Война и мир', 'pub_date': '1869-01-01T00:00:00'},
+    {'type': 'post', 'id': 502, 'author': 'ghost', 'text': 'Пропадёт'},
+    {'type': 'comment', 'post': 501, 'author': 'anna', 'text': 'Длинно'},
+    {'type': 'follow', 'user': 'anna', 'author': 'leo'},
+]
+
+
+class ImportCommandTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def run_import(self, *args):
+        output = StringIO()
+        call_command('import_yatube', *args, stdout=output)
+        return output.getvalue()
+
+    def test_import_ndjson(self):
+        """Импорт пишет записи и в конце пересчитывает производные."""
+        path = self.write(
+            'dump.ndjson',
+            '\n'.join(json.dumps(record) for record in RECORDS)
+        )
+        output = self.run_import(path, '--batch-size', '2')
+        self.assertIn('строк/с', output)
+        post = Post.objects.get(pk=501)
+        self.assertEqual(post.pub_date.year, 1869)
+        self.assertEqual(post.group.slug, 'books')
+        self.assertFalse(Post.objects.filter(pk=502).exists())
+        self.assertEqual(Comment.objects.get().post, post)
+        self.assertTrue(
+            Follow.objects.filter(user__username='anna').exists()
+        )
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Group.objects.get().posts_count, 1)
+        leo = User.objects.get(username='leo')
+        self.assertEqual(leo.stats.followers_count, 1)
+        self.assertFalse(leo.has_usable_password())
+        self.assertTrue(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(list(search.search('война')), [post])
+
+    def test_dates_and_side_effects_of_imported_rows_only(self):
+        """Даты из файла сохраняются, производные — только у новых строк."""
+        leo = User.objects.create_user(username='leo')
+        old = Post.objects.create(author=leo, text='Старый')
+        other = Post.objects.create(author=leo, text='Чужой')
+        # Расхождение у незатронутого поста импорт не исправляет.
+        Post.objects.filter(pk=other.pk).update(comments_count=7)
+        cache.set('unrelated', 'value')
+        records = [
+            {'type': 'post', 'id': old.pk, 'author': 'leo',
+             'text': 'Дубль', 'pub_date': '1900-01-01T00:00:00'},
+            {'type': 'post', 'author': 'leo', 'text': 'Без id',
+             'pub_date': '1901-01-01T00:00:00'},
+            {'type': 'comment', 'post': old.pk, 'author': 'leo',
+             'text': 'Отзыв', 'pub_date': '1902-01-01T00:00:00'},
+        ]
+        path = self.write(
+            'dump.ndjson',
+            '\n'.join(json.dumps(record) for record in records)
+        )
+        self.run_import(path)
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+        self.assertTrue(Comment._meta.get_field('pub_date').auto_now_add)
+        old.refresh_from_db()
+        self.assertEqual(old.text, 'Старый')
+        self.assertEqual(old.pub_date.year, timezone.now().year)
+        self.assertEqual(old.comments_count, 1)
+        self.assertEqual(
+            Post.objects.get(text='Без id').pub_date.year, 1901
+        )
+        self.assertEqual(Comment.objects.get().pub_date.year, 1902)
+        self.assertEqual(Post.objects.get(pk=other.pk).comments_count, 7)
+        self.assertEqual(cache.get('unrelated'), 'value')
+
+    def test_checkpoint_resumes(self):
+        """Повторный запуск с чекпоинтом пропускает записанные строки."""
+        users = self.write('users.csv', 'username,first_name\nleo,Лев\n')
+        posts = self.write(
+            'posts.csv',
+            'id,author,text\n601,leo,Первый\n602,leo,Второй\n'
+        )
+        checkpoint = os.path.join(self.directory, 'import.json')
+        self.run_import(users, posts, '--checkpoint', checkpoint)
+        with open(checkpoint) as file:
+            self.assertEqual(
+                sorted(json.load(file)['positions'].values()), [1, 2]
+            )
+        Post.objects.filter(pk=602).delete()
+        output = self.run_import(
+            posts, '--checkpoint', checkpoint, '--skip-side-effects'
+        )
+        self.assertIn('пропускаю 2', output)
+        self.assertFalse(Post.objects.filter(pk=602).exists())
+
+    def test_resume_applies_side_effects_to_earlier_rows(self):
+        """Производные строк, записанных до сбоя, пересчитывает повтор."""
+        users = self.write('users.csv', 'username\nleo\n')
+        posts = self.write(
+            'posts.csv', 'id,author,text\n701,leo,Ранний\n'
+        )
+        checkpoint = os.path.join(self.directory, 'import.json')
+        # Как если бы процесс упал до пересчёта производных.
+        self.run_import(
+            users, posts, '--checkpoint', checkpoint, '--skip-side-effects'
+        )
+        self.assertEqual(list(search.search('ранний')), [])
+        more = self.write(
+            'more.csv', 'id,author,text\n702,leo,Поздний\n'
+        )
+        self.run_import(
+            users, posts, more, '--type', 'post', '--checkpoint', checkpoint
+        )
+        self.assertEqual(
+            [post.pk for post in search.search('ранний')], [701]
+        )
+        self.assertEqual(
+            [post.pk for post in search.search('поздний')], [702]
+        )
+        self.assertEqual(User.objects.get().stats.posts_count, 2)
+        with open(checkpoint) as file:
+            self.assertFalse(any(json.load(file)['touched'].values()))
+
+    def test_conflicts_are_reported_as_skipped(self):
+        path = self.write(
+            'dump.ndjson',
+            '\n'.join(json.dumps(record) for record in RECORDS)
+        )
+        self.run_import(path)
+        output = self.run_import(path)
+        self.assertIn('post: 0, пропущено 2', output)
+        self.assertIn('user: 0, пропущено 2', output)
+
+
+class SeedCommandTests(TestCase):
+    @staticmethod
+    def generate(seed):
+        seeder = Seeder(seed=seed)
+        return list(itertools.chain(
+            seeder.users(30),
+            seeder.groups(3),
+            seeder.posts(100, first_id=1),
+            seeder.comments(2),
+            seeder.follows(5),
+        ))
+
+    def test_same_seed_same_data(self):
+        self.assertEqual(self.generate(7), self.generate(7))
+        self.assertNotEqual(self.generate(7), self.generate(8))
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_seed(self):
+        """Данные пишутся в базу, популярные авторы пишут больше."""
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT, True)
+        call_command(
+            'seed_yatube', '--users', '30', '--posts', '200',
+            '--follows-per-user', '5', '--comments-per-post', '2',
+            '--images', '2', '--seed', '1', stdout=StringIO()
+        )
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Follow.objects.count(), 30 * 5)
+        self.assertEqual(Post.objects.exclude(image='').count(), 2)
+        post_counts = list(User.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').values_list('total', flat=True))
+        # Первые 10% авторов пишут больше трети постов.
+        self.assertGreater(sum(post_counts[:3]), 200 / 3)
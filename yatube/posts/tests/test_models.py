@@ -1,7 +1,13 @@
+from io import StringIO
+from unittest import skipUnless
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post
+from ..models import Comment, Follow, Group, Post, TimelineEntry, UserStats
 
 User = get_user_model()
 
@@ -22,6 +28,32 @@ class PostModelTest(TestCase):
         expected_object_text = post.text
         self.assertEqual(expected_object_text, str(post.text))
 
+    def test_text_html_is_rendered_on_save(self):
+        post = Post.objects.create(author=self.user, text='<b>раз</b>\nдва')
+        self.assertEqual(post.text_html, '&lt;b&gt;раз&lt;/b&gt;<br>два')
+        post.text = 'три'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, 'три')
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='a & b'
+        )
+        self.assertEqual(comment.html, 'a &amp; b')
+
+    def test_render_text_html_command(self):
+        """Команда заполняет HTML строк, записанных в обход save()."""
+        Post.objects.filter(pk=self.post.pk).update(text_html='')
+        Post.objects.bulk_create([
+            Post(author=self.user, text=f'пост\n{i}') for i in range(3)
+        ])
+        call_command(
+            'render_text_html', '--batch-size', '2', stdout=StringIO()
+        )
+        self.assertFalse(Post.objects.filter(text_html='').exists())
+        self.assertEqual(
+            Post.objects.get(text='пост\n2').text_html, 'пост<br>2'
+        )
+
 
 class GroupModelTest(TestCase):
     @classmethod
@@ -37,3 +69,154 @@ class GroupModelTest(TestCase):
         group = self.group
         expected_object_title = group.title
         self.assertEqual(expected_object_title, str(group.title))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(
+            author=self.author, text='Тестовый пост', group=self.group
+        )
+        Comment.objects.create(author=self.reader, post=post, text='Ок')
+        Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 1
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1
+        )
+        post.group = None
+        post.save()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        post.delete()
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 0
+        )
+
+    def test_post_delete_does_not_depend_on_comments(self):
+        """Каскад комментариев не пересчитывает удаляемый пост."""
+        def deletion_queries(comments):
+            post = Post.objects.create(author=self.author, text='Пост')
+            Comment.objects.bulk_create(
+                [Comment(author=self.reader, post=post, text='Ок')]
+                * comments
+            )
+            with CaptureQueriesContext(connection) as queries:
+                post.delete()
+            return len(queries)
+
+        self.assertEqual(deletion_queries(2), deletion_queries(20))
+        comment_post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            author=self.reader, post=comment_post, text='Ок'
+        )
+        comment.delete()
+        comment_post.refresh_from_db()
+        self.assertEqual(comment_post.comments_count, 0)
+        # Удаление автора уносит и его посты, и его комментарии к чужим.
+        commenter = User.objects.create_user(username='commenter')
+        own_post = Post.objects.create(author=commenter, text='Свой')
+        Comment.objects.create(author=commenter, post=own_post, text='Ок')
+        Comment.objects.create(author=commenter, post=comment_post, text='Ок')
+        commenter.delete()
+        comment_post.refresh_from_db()
+        self.assertEqual(comment_post.comments_count, 0)
+
+    def test_rebuild_counters_command(self):
+        Post.objects.bulk_create(
+            [Post(author=self.author, text='bulk', group=self.group)] * 3
+        )
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('rebuild_counters', stdout=StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 3)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 3
+        )
+        self.assertTrue(UserStats.objects.filter(user=self.reader).exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть в SQLite')
+class QueryPlanTest(TestCase):
+    """Ленты и подписки читаются по индексам, а не полным просмотром."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.explain(queryset)
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_feed_indexes(self):
+        ordering = ('-pub_date', '-id')
+        cases = {
+            'post_pub_date_idx': Post.objects.filter(
+                pub_date__lt=self.post.pub_date
+            ).order_by(*ordering)[:10],
+            'post_author_pub_date_idx': Post.objects.filter(
+                author=self.user
+            ).order_by(*ordering)[:10],
+            'post_group_pub_date_idx': Post.objects.filter(
+                group=self.group
+            ).order_by(*ordering)[:10],
+            'comment_post_pub_date_idx': Comment.objects.filter(
+                post=self.post
+            ).order_by('pub_date', 'id')[:10],
+            'timeline_user_pub_date_idx': TimelineEntry.objects.filter(
+                user=self.user
+            ).order_by(*ordering)[:10],
+        }
+        for index, queryset in cases.items():
+            with self.subTest(index=index):
+                self.assertUsesIndex(queryset, index)
+        # Первая страница общей ленты и дата новейшего поста для ETag.
+        self.assertUsesIndex(
+            Post.objects.order_by(*ordering)[:10], 'post_pub_date_idx'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'EXPLAIN QUERY PLAN SELECT MAX(pub_date) FROM posts_post'
+            )
+            plan = ' | '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('post_pub_date_idx', plan)
+
+    def test_follow_pair_lookup(self):
+        plan = self.explain(
+            Follow.objects.filter(user=self.user, author=self.user)
+        )
+        self.assertIn('INDEX', plan)
+        self.assertIn('(user_id=? AND author_id=?)', plan)
@@ -1,12 +1,29 @@
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from http import HTTPStatus
+from unittest.mock import patch
+
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from core import routers
 
-from ..models import Post, Group, Comment, Follow
+from .. import caching, follows, search, thumbnails, trending
+from ..models import (Comment, Follow, Group, Post, PostSearch, SearchTerm,
+                      TimelineEntry, TrendingGroup, TrendingPost)
+from ..paginators import CursorPaginator, WindowedPaginator
+from ..templatetags.post_images import post_picture
+from .utils import run_on_commit
 
 User = get_user_model()
 
@@ -219,19 +236,58 @@ class TaskPagesTests(TestCase):
         self.assertEqual(first_object, comment)
 
     def test_work_of_cache(self):
+        """Фрагмент главной живёт в кэше, пока его не сбросит сигнал."""
         response1 = self.authorized_client.get(reverse('posts:index'))
-        Post.objects.create(
-            author=self.user,
-            text='test-cache'
+        # update() обходит сигналы и save(): HTML текста меняем сами.
+        Post.objects.filter(pk=self.post.pk).update(
+            text='changed-quietly',
+            text_html='changed-quietly'
         )
         response2 = self.authorized_client.get(reverse('posts:index'))
-        request_object_before_post = response1.context['page_obj'][0]
-        request_object_after_post = response2.context['page_obj'][0]
-        self.assertEqual(request_object_before_post, request_object_after_post)
+        self.assertEqual(response1.content, response2.content)
         cache.clear()
         response3 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response1.content, response3.content)
 
+    def test_post_cards_are_cached_separately(self):
+        """Правка поста перестраивает только его карточку."""
+        other = Post.objects.create(author=self.user, text='other-text')
+        self.authorized_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=other.pk).update(
+            text='other-quietly',
+            text_html='other-quietly'
+        )
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'edited-text'
+        post.save()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'edited-text')
+        self.assertContains(response, 'other-text')
+        self.assertNotContains(response, 'other-quietly')
+
+    def test_cache_invalidated_by_signals(self):
+        """Новый пост, правка группы и имени автора видны сразу."""
+        self.authorized_client.get(reverse('posts:index'))
+        Post.objects.create(author=self.user, text='test-cache')
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'test-cache')
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'new-group-title'
+        group.save()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'new-group-title')
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Станислав'
+        author.save()
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        ):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Станислав')
+
     def test_follow_on_users(self):
         maxim = User.objects.create_user(username='Maxim')
         Post.objects.create(
@@ -283,6 +339,213 @@ class TaskPagesTests(TestCase):
         objects2 = response2.context['page_obj']
         self.assertNotIn(post1, objects2)
 
+    def test_timeline_follows_subscriptions(self):
+        """Лента подписок заполняется при публикации и подписке."""
+        maxim = User.objects.create_user(username='Maxim')
+        old_post = Post.objects.create(author=maxim, text='old-post')
+        Follow.objects.create(user=self.user, author=maxim)
+        new_post = Post.objects.create(author=maxim, text='new-post')
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(
+                user=self.user
+            ).values_list('post_id', flat=True)),
+            [new_post.pk, old_post.pk]
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, old_post]
+        )
+        Follow.objects.filter(user=self.user, author=maxim).delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_timeline_after_crossing_fanout_limit(self):
+        """Посты, вышедшие выше предела, не пропадают после отписок."""
+        maxim = User.objects.create_user(username='Maxim')
+        gor = User.objects.create_user(username='Gor')
+        Follow.objects.create(user=self.user, author=maxim)
+        Follow.objects.create(user=gor, author=maxim)
+        pulled = Post.objects.create(author=maxim, text='pulled-post')
+        self.assertFalse(TimelineEntry.objects.filter(post=pulled).exists())
+        url = reverse('posts:follow_index')
+        response = self.authorized_client.get(url)
+        self.assertIn(pulled, response.context['page_obj'])
+        Follow.objects.filter(user=gor, author=maxim).delete()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=pulled
+        ).exists())
+        response = self.authorized_client.get(url)
+        self.assertIn(pulled, response.context['page_obj'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_timeline_pulls_popular_authors(self):
+        """Посты популярных авторов читаются без раскладки по лентам."""
+        maxim = User.objects.create_user(username='Maxim')
+        Follow.objects.create(user=self.user, author=maxim)
+        post = Post.objects.create(author=maxim, text='popular-post')
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+    def test_follow_graph_cache(self):
+        """Граф подписок в кэше меняется вместе с подписками."""
+        cache.clear()
+        maxim = User.objects.create_user(username='Maxim')
+        post = Post.objects.create(author=maxim, text='followed-post')
+        self.assertFalse(follows.is_following(self.user.pk, maxim.pk))
+        url = reverse('posts:profile_follow', args=[maxim.username])
+        with run_on_commit():
+            self.authorized_client.post(url)
+        self.authorized_client.post(url)
+        self.assertEqual(Follow.objects.filter(author=maxim).count(), 1)
+        self.assertTrue(follows.is_following(self.user.pk, maxim.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(follows.is_following(self.user.pk, maxim.pk))
+            self.assertEqual(
+                follows.followed_among(
+                    self.user.pk, [maxim.pk, self.user.pk]
+                ),
+                {maxim.pk}
+            )
+        response = self.authorized_client.get(
+            reverse('posts:profile', args=[maxim.username])
+        )
+        self.assertTrue(response.context['following'])
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertIn(post, response.context['page_obj'])
+        self.assertEqual(response.context['followed_authors'], {maxim.pk})
+        self.assertContains(response, 'Вы подписаны на автора', count=1)
+        with run_on_commit():
+            self.authorized_client.post(
+                reverse('posts:profile_unfollow', args=[maxim.username])
+            )
+        self.assertFalse(follows.is_following(self.user.pk, maxim.pk))
+
+    def test_rolled_back_follow_keeps_graph(self):
+        """Откат подписки не оставляет её в кэше."""
+        cache.clear()
+        maxim = User.objects.create_user(username='Maxim')
+        self.assertFalse(follows.is_following(self.user.pk, maxim.pk))
+        with run_on_commit():
+            try:
+                with transaction.atomic():
+                    Follow.objects.create(user=self.user, author=maxim)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertFalse(follows.is_following(self.user.pk, maxim.pk))
+        with run_on_commit():
+            Follow.objects.create(user=self.user, author=maxim)
+            # До фиксации кэш не правится.
+            self.assertFalse(follows.is_following(self.user.pk, maxim.pk))
+        self.assertTrue(follows.is_following(self.user.pk, maxim.pk))
+
+    def test_follow_repairs_stale_graph(self):
+        """Повторная подписка чинит кэш, который потерял подписку."""
+        cache.clear()
+        maxim = User.objects.create_user(username='Maxim')
+        Follow.objects.create(user=self.user, author=maxim)
+        cache.set(
+            follows.FOLLOWING_PREFIX + str(self.user.pk), follows._pack([])
+        )
+        self.assertFalse(follows.is_following(self.user.pk, maxim.pk))
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=[maxim.username])
+        )
+        self.assertTrue(follows.is_following(self.user.pk, maxim.pk))
+        self.assertEqual(Follow.objects.filter(author=maxim).count(), 1)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_picture_variants(self):
+        """Пока вариантов нет, выводится оригинал, затем <picture>."""
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT, True)
+        buffer = io.BytesIO()
+        Image.new('RGB', (1000, 500), 'red').save(buffer, 'PNG')
+        post = Post.objects.create(
+            author=self.user,
+            text='test-picture',
+            image=SimpleUploadedFile(
+                name='picture.png',
+                content=buffer.getvalue(),
+                content_type='image/png'
+            )
+        )
+        self.assertIsNone(thumbnails.ready_variants(post.image))
+        # В тестах THUMBNAIL_WORKERS = 0: построение идёт сразу.
+        self.assertEqual(post_picture(post), {'src': post.image.url})
+        webp, png = thumbnails.ready_variants(post.image)
+        self.assertEqual(webp['type'], 'image/webp')
+        self.assertEqual(png['type'], 'image/png')
+        # Варианты вписаны в рамку 960x339 и не больше исходника.
+        self.assertEqual(
+            [variant[1:] for variant in png['variants']],
+            [[226, 113], [452, 226], [678, 339], [1000, 500]]
+        )
+        context = post_picture(post)
+        self.assertIn('.webp 1000w', context['sources'][0]['srcset'])
+        self.assertIn('.png 226w', context['srcset'])
+        self.assertEqual((context['width'], context['height']), (1000, 500))
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Stanislav')
+        cls.post = Post.objects.create(author=cls.user, text='test-text')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+
+    def test_conditional_get(self):
+        """Повторный запрос с If-None-Match получает 304 без рендеринга."""
+        response = self.guest_client.get(self.url)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        response = self.guest_client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response.templates, [])
+
+    def test_cached_page_and_invalidation(self):
+        first = self.guest_client.get(self.url)
+        cached = self.guest_client.get(self.url)
+        self.assertEqual(cached.templates, [])
+        self.assertEqual(cached.content, first.content)
+        Comment.objects.create(
+            author=self.user, post=self.post, text='new-comment'
+        )
+        response = self.guest_client.get(
+            self.url, HTTP_IF_NONE_MATCH=first['ETag']
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertContains(response, 'new-comment')
+
+    def test_generations_move_after_commit(self):
+        """Новое поколение видно только вместе с новыми строками."""
+        scope = caching.post_scope(self.post.pk)
+        before = caching.generations(scope)
+        with run_on_commit():
+            Comment.objects.create(
+                author=self.user, post=self.post, text='new-comment'
+            )
+            self.assertEqual(caching.generations(scope), before)
+        self.assertNotEqual(caching.generations(scope), before)
+
+    def test_authorized_pages_are_not_cached(self):
+        client = Client()
+        client.force_login(self.user)
+        client.get(self.url)
+        response = client.get(self.url)
+        self.assertNotIn('ETag', response)
+        self.assertTemplateUsed(response, 'posts/post_detail.html')
+
 
 class PaginatorTests(TestCase):
     @classmethod
@@ -307,6 +570,8 @@ class PaginatorTests(TestCase):
         self.authorized_client = Client()
         self.guest_client = Client()
         self.authorized_client.force_login(self.user)
+        # Анонимные страницы кэшируются целиком между тестами класса.
+        cache.clear()
 
     def test_first_page_contains_ten_records(self):
         response = self.guest_client.get(reverse('posts:index'))
@@ -344,3 +609,373 @@ class PaginatorTests(TestCase):
             len(response.context['page_obj']),
             settings.NUMBER_TEN
         )
+
+    def test_cursor_pages_of_index(self):
+        """Курсоры ведут по ленте без пропусков и повторов."""
+        response = self.guest_client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+        response = self.guest_client.get(
+            reverse('posts:index') + f'?after={first_page.next_cursor}'
+        )
+        second_page = response.context['page_obj']
+        self.assertIsInstance(
+            second_page.paginator, CursorPaginator
+        )
+        self.assertEqual(len(second_page), 5)
+        self.assertFalse(second_page.has_next())
+        seen = list(first_page) + list(second_page)
+        self.assertEqual(seen, list(Post.objects.order_by('-pub_date', '-id')))
+        response = self.guest_client.get(
+            reverse('posts:index') + f'?before={second_page.previous_cursor}'
+        )
+        self.assertEqual(list(response.context['page_obj']), list(first_page))
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.guest_client.get(
+            reverse('posts:index') + '?after=broken'
+        )
+        self.assertEqual(
+            len(response.context['page_obj']),
+            settings.NUMBER_TEN
+        )
+
+    def test_page_window(self):
+        """Ссылки на страницы выводятся окном, а не все подряд."""
+        paginator = WindowedPaginator(list(range(500)), 10)
+        self.assertEqual(
+            paginator.window(25), [1, None, 23, 24, 25, 26, 27, None, 50]
+        )
+        self.assertEqual(paginator.window(2), [1, 2, 3, 4, None, 50])
+        self.assertEqual(WindowedPaginator([1], 10).window(1), [1])
+
+    def test_page_count_is_cached(self):
+        url = reverse('posts:group_posts', args=[self.group.slug])
+        self.authorized_client.get(url + '?page=2')
+        with self.assertNumQueries(4):
+            # Сессия, пользователь, группа и посты страницы — без COUNT(*).
+            response = self.authorized_client.get(url + '?page=2')
+        self.assertEqual(response.context['page_obj'].paginator.count, 15)
+        self.assertContains(response, '?page=1')
+        with run_on_commit():
+            Post.objects.create(
+                author=self.user, text='new', group=self.group
+            )
+        response = self.authorized_client.get(url + '?page=2')
+        self.assertEqual(response.context['page_obj'].paginator.count, 16)
+
+    def test_cached_page_count_is_read_from_primary(self):
+        """Реплика может отставать: число для кэша — из основной базы."""
+        cache.clear()
+        reads = []
+
+        def db_for_read(router, model, **hints):
+            reads.append(routers.reading_replica())
+            return 'default'
+
+        @routers.read_from_replica
+        def count(request):
+            return WindowedPaginator(
+                Post.objects.filter(group=self.group).order_by('pk'),
+                10,
+                scopes=[caching.group_scope(self.group.pk)]
+            ).count
+
+        route = patch.object(
+            routers.PrimaryReplicaRouter, 'db_for_read', db_for_read
+        )
+        with patch.object(routers, 'available', return_value=True), route:
+            self.assertEqual(count(RequestFactory().get('/')), 15)
+        self.assertTrue(reads)
+        self.assertFalse(any(reads))
+
+    @override_settings(PAGINATOR_ESTIMATE_THRESHOLD=10)
+    def test_estimated_count(self):
+        """Для всей таблицы число берётся из статистики SQLite."""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Post.objects.create(author=self.user, text='not-analyzed')
+        paginator = WindowedPaginator(Post.objects.order_by('pk'), 10)
+        self.assertEqual(paginator.count, 15)
+        self.assertTrue(paginator.estimated)
+        # Выборка с условием считается точно.
+        paginator = WindowedPaginator(
+            Post.objects.filter(group=self.group).order_by('pk'), 10
+        )
+        self.assertEqual(paginator.count, 15)
+        self.assertFalse(paginator.estimated)
+
+    @override_settings(PAGINATOR_ESTIMATE_THRESHOLD=10)
+    def test_estimated_count_hides_last_page(self):
+        """По заниженной оценке страницы за «последней» всё же есть."""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Post.objects.bulk_create(
+            Post(author=self.user, text='not-analyzed') for _ in range(10)
+        )
+        paginator = WindowedPaginator(Post.objects.order_by('pk'), 10)
+        self.assertEqual(paginator.num_pages, 2)
+        page = paginator.get_page(2)
+        self.assertEqual(len(page), 10)
+        self.assertTrue(page.has_next())
+        self.assertEqual(page.window, [1, 2, None])
+        page = paginator.get_page(3)
+        self.assertEqual(page.number, 3)
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_next())
+        self.assertEqual(page.window, [1, 2, 3])
+        response = self.guest_client.get(reverse('posts:index') + '?page=2')
+        self.assertNotContains(response, 'Последняя')
+
+
+@override_settings(COMMENTS_PER_PAGE=5)
+class CommentPagesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Stanislav')
+        cls.post = Post.objects.create(author=cls.user, text='test-text')
+        readers = [
+            User.objects.create_user(username=f'reader{i}')
+            for i in range(12)
+        ]
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=reader, text=f'comment {i}')
+            for i, reader in enumerate(readers)
+        ])
+        cls.ordered = list(Comment.objects.order_by('pub_date', 'id'))
+
+    def test_comments_are_paginated_without_extra_queries(self):
+        """Авторы приходят вместе с комментариями одним запросом."""
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.ordered[:5])
+        self.assertTrue(comments.has_next())
+
+    def test_load_more_fragment(self):
+        url = reverse('posts:post_comments', args=(self.post.pk,))
+        response = self.client.get(url)
+        comments = response.context['comments']
+        seen = list(comments)
+        while comments.has_next():
+            response = self.client.get(f'{url}?after={comments.next_cursor}')
+            self.assertTemplateNotUsed(response, 'base.html')
+            comments = response.context['comments']
+            seen += list(comments)
+        self.assertEqual(seen, self.ordered)
+        self.assertContains(response, 'comment 11')
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_fragment_of_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk + 1,))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Stanislav')
+        cls.reader = User.objects.create_user(username='Maxim')
+        cls.quiet = Group.objects.create(title='quiet', slug='quiet')
+        cls.busy = Group.objects.create(title='busy', slug='busy')
+        cls.old = Post.objects.create(
+            author=cls.author, text='old', group=cls.quiet
+        )
+        cls.fresh = Post.objects.create(
+            author=cls.author, text='fresh', group=cls.busy
+        )
+        cls.silent = Post.objects.create(author=cls.reader, text='silent')
+        now = timezone.now()
+        for hours, post in ((30, cls.old), (30, cls.old), (1, cls.fresh)):
+            comment = Comment.objects.create(
+                author=cls.reader, post=post, text='comment'
+            )
+            Comment.objects.filter(pk=comment.pk).update(
+                pub_date=now - timedelta(hours=hours)
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_scores_decay(self):
+        """Свежий комментарий весит больше двух старых."""
+        posts, groups = trending.rebuild()
+        self.assertEqual((posts, groups), (2, 2))
+        self.assertEqual(
+            list(TrendingPost.objects.values_list('post', flat=True)),
+            [self.fresh.pk, self.old.pk]
+        )
+        self.assertEqual(
+            list(TrendingGroup.objects.values_list('group', flat=True)),
+            [self.busy.pk, self.quiet.pk]
+        )
+        # Аудитория автора поднимает и пост без комментариев.
+        Follow.objects.create(user=self.author, author=self.reader)
+        trending.rebuild()
+        self.assertTrue(
+            TrendingPost.objects.filter(post=self.silent).exists()
+        )
+
+    def test_popular_page(self):
+        trending.rebuild()
+        url = reverse('posts:popular')
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(
+            list(response.context['page_obj']), [self.fresh, self.old]
+        )
+        self.assertContains(response, reverse('posts:group_posts',
+                                              args=['busy']))
+        # Пересчёт сбрасывает полностраничный кэш.
+        Comment.objects.create(
+            author=self.reader, post=self.old, text='comment'
+        )
+        Comment.objects.create(
+            author=self.reader, post=self.old, text='comment'
+        )
+        with run_on_commit():
+            trending.rebuild()
+        response = self.client.get(url)
+        self.assertEqual(
+            list(response.context['page_obj']), [self.old, self.fresh]
+        )
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Searcher')
+        cls.in_text = Post.objects.create(
+            author=cls.user,
+            text='Рецепт: ржаной хлеб на закваске'
+        )
+        cls.in_comment = Post.objects.create(
+            author=cls.user,
+            text='Что испечь в выходные?'
+        )
+        Comment.objects.create(
+            post=cls.in_comment,
+            author=cls.user,
+            text='Испеки хлеб'
+        )
+        Post.objects.create(author=cls.user, text='Про погоду')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def found(self, query, **params):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response.context['page_obj']
+
+    def check_search(self):
+        self.assertEqual(
+            list(self.found('ХЛЕБ')), [self.in_text, self.in_comment]
+        )
+        self.assertEqual(list(self.found('хлеб закваске')), [self.in_text])
+        self.assertEqual(list(self.found('хлеб пирог')), [])
+        self.assertEqual(list(self.found('!!!')), [])
+        Comment.objects.filter(post=self.in_comment).delete()
+        self.assertEqual(list(self.found('хлеб')), [self.in_text])
+        post = Post.objects.get(pk=self.in_text.pk)
+        post.text = 'Рецепт: пирог'
+        post.save()
+        self.assertEqual(list(self.found('хлеб')), [])
+        self.assertEqual(list(self.found('пирог')), [post])
+        post.delete()
+        self.assertEqual(list(self.found('пирог')), [])
+
+    def test_search_fts(self):
+        """Поиск по FTS5 учитывает посты и комментарии к ним."""
+        self.assertTrue(search.uses_fts())
+        self.check_search()
+
+    def test_search_terms(self):
+        """Без FTS5 поиск идёт по таблице слов SearchTerm."""
+        with patch.object(search, 'uses_fts', return_value=False):
+            search.rebuild()
+            self.assertTrue(
+                SearchTerm.objects.filter(term='закваске').exists()
+            )
+            self.check_search()
+
+    def test_comments_are_indexed_incrementally(self):
+        """Комментарий пишется в индекс так же, как rebuild."""
+        def snapshot():
+            if search.uses_fts():
+                first_row = self.in_comment.pk * search.POST_ROWS
+                return list(PostSearch.objects.filter(
+                    pk__gte=first_row,
+                    pk__lt=first_row + search.POST_ROWS
+                ).order_by('pk').values_list('pk', 'text', 'comments'))
+            return set(SearchTerm.objects.filter(
+                post=self.in_comment
+            ).values_list('term', 'weight'))
+
+        for fts in (True, False):
+            with self.subTest(fts=fts), \
+                    patch.object(search, 'uses_fts', return_value=fts):
+                search.rebuild()
+                with patch.object(search, 'index_posts') as index_posts:
+                    comment = Comment.objects.create(
+                        post=self.in_comment,
+                        author=self.user,
+                        text='хлеб и ещё раз хлеб'
+                    )
+                index_posts.assert_not_called()
+                incremental = snapshot()
+                search.rebuild()
+                self.assertEqual(incremental, snapshot())
+                with patch.object(search, 'index_posts') as index_posts:
+                    comment.text = 'пирог'
+                    comment.save()
+                    self.in_comment.comments.exclude(pk=comment.pk).delete()
+                self.assertEqual(index_posts.called, not fts)
+                if not fts:
+                    search.index_posts([self.in_comment.pk])
+                incremental = snapshot()
+                search.rebuild()
+                self.assertEqual(incremental, snapshot())
+                comment.delete()
+
+    def test_search_cursor_pages(self):
+        """Результаты листаются курсором, запрос сохраняется в ссылках."""
+        Post.objects.bulk_create([
+            Post(author=self.user, text='хлеб ' * (number + 1))
+            for number in range(settings.NUMBER_TEN)
+        ])
+        search.rebuild()
+        first_page = self.found('хлеб')
+        self.assertEqual(len(first_page), settings.NUMBER_TEN)
+        ranks = [post.rank for post in first_page]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        second_page = self.found('хлеб', after=first_page.next_cursor)
+        self.assertEqual(len(second_page), 2)
+        self.assertFalse(set(first_page) & set(second_page))
+        response = self.guest_client.get(
+            reverse('posts:search'),
+            {'q': 'хлеб', 'after': first_page.next_cursor}
+        )
+        self.assertContains(response, '?q=%D1%85%D0%BB%D0%B5%D0%B1&amp;')
+
+    def test_admin_search(self):
+        """Поиск в админке идёт по тому же индексу."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.guest_client.force_login(admin)
+        response = self.guest_client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'хлеб'}
+        )
+        self.assertEqual(
+            set(response.context['cl'].result_list),
+            {self.in_text, self.in_comment}
+        )
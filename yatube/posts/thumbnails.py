@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import caching, imaging
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+MANIFEST_PREFIX = 'image_variants:'
+
+_executor = None
+_processes = None
+_lock = threading.Lock()
+# Картинки, варианты которых уже строятся в этом процессе.
+_pending = set()
+
+
+def _variant_name(name, width, image_format):
+    return posixpath.join(VARIANTS_DIR, '%s.%sw.%s' % (
+        name, width, imaging.EXTENSIONS[image_format]
+    ))
+
+
+def _manifest_name(name):
+    return posixpath.join(VARIANTS_DIR, name + '.json')
+
+
+def _manifest_key(name):
+    return MANIFEST_PREFIX + hashlib.md5(name.encode()).hexdigest()
+
+
+def ready_variants(image):
+    """
+    Готовые варианты картинки: список источников вида
+    {'type': MIME-тип, 'variants': [[имя файла, ширина, высота], ...]},
+    WebP первым. None, если варианты ещё не построены.
+
+    Описание берётся из кэша, а при промахе — из файла рядом
+    с вариантами, чтобы вытеснение из кэша не вело к перекодированию.
+    """
+    key = _manifest_key(image.name)
+    manifest = cache.get(key)
+    if manifest is None:
+        try:
+            with default_storage.open(_manifest_name(image.name)) as file:
+                manifest = json.loads(file.read())
+        except (OSError, ValueError, SuspiciousFileOperation):
+            return None
+        cache.set(key, manifest, None)
+    return manifest
+
+
+def _process_pool():
+    global _processes
+    with _lock:
+        if _processes is None:
+            # spawn: дочерним процессам не достаются соединения с базой
+            # и потоки родителя, а imaging не требует настройки Django.
+            _processes = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _processes
+
+
+def _render(data):
+    args = (
+        data,
+        settings.POST_IMAGE_WIDTHS,
+        settings.POST_IMAGE_HEIGHT_RATIO,
+    )
+    if not settings.IMAGE_PROCESSES:
+        return imaging.render_variants(*args)
+    return _process_pool().submit(imaging.render_variants, *args).result()
+
+
+def _save(name, content):
+    # Имена вариантов постоянные: повторное построение их перезаписывает.
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(content))
+
+
+def generate(name, scopes=()):
+    """Строит все варианты картинки и сбрасывает кэш страниц с ней."""
+    try:
+        with default_storage.open(name) as source:
+            data = source.read()
+        sources = {}
+        for width, height, image_format, content in _render(data):
+            saved = _save(_variant_name(name, width, image_format), content)
+            sources.setdefault(imaging.MIME_TYPES[image_format], []).append(
+                [saved, width, height]
+            )
+        manifest = [
+            {'type': mime_type, 'variants': variants}
+            for mime_type, variants in sources.items()
+        ]
+        _save(_manifest_name(name), json.dumps(manifest).encode())
+        cache.set(_manifest_key(name), manifest, None)
+    except Exception:
+        logger.exception('Не удалось построить варианты картинки %s', name)
+    else:
+        caching.touch_posts(Post.objects.filter(image=name))
+        caching.bump(*scopes)
+    finally:
+        with _lock:
+            _pending.discard(name)
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def schedule(name, scopes=()):
+    """
+    Отдаёт построение вариантов пулу потоков, если оно ещё не запущено;
+    при THUMBNAIL_WORKERS = 0 строит их сразу.
+    """
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    if settings.THUMBNAIL_WORKERS:
+        _pool().submit(generate, name, scopes)
+    else:
+        generate(name, scopes)
+
+
+def enqueue(post):
+    """Ставит варианты картинки поста в очередь после фиксации транзакции."""
+    if post.image and ready_variants(post.image) is None:
+        name = post.image.name
+        scopes = caching.post_scopes(post)
+        transaction.on_commit(lambda: schedule(name, scopes))
@@ -0,0 +1,193 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from . import caching
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginators import FEED_ORDERING, get_page
+
+# Связи поста, которые выводит лента.
+FEED_RELATED = ('author', 'group')
+
+
+def is_fanout_author(author_id):
+    """Раскладываются ли посты автора по лентам при публикации."""
+    # Тот же счётчик читают pull_authors и rebuild: решение о раскладке
+    # должно совпадать с решением о подмешивании при чтении.
+    followers = UserStats.objects.filter(
+        user_id=author_id
+    ).values_list('followers_count', flat=True).first()
+    return (followers or 0) <= settings.TIMELINE_FANOUT_LIMIT
+
+
+def _entries(user_ids, posts):
+    for user_id in user_ids:
+        for post_id, pub_date in posts:
+            yield TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                pub_date=pub_date
+            )
+
+
+def _bulk_insert(entries):
+    # Записи читаются из генератора кусками, чтобы не держать в памяти
+    # ленты всех подписчиков сразу; размер одного INSERT Django
+    # подбирает сам с учётом пределов SQLite.
+    while True:
+        chunk = list(islice(entries, settings.TIMELINE_BATCH_SIZE))
+        if not chunk:
+            return
+        TimelineEntry.objects.bulk_create(chunk, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    if not is_fanout_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _bulk_insert(
+        _entries(followers.iterator(), [(post.pk, post.pub_date)])
+    )
+
+
+def fan_out_author(author_id):
+    """
+    Раскладывает все посты автора по лентам всех его подписчиков.
+    Нужна, когда автор опускается до TIMELINE_FANOUT_LIMIT: посты,
+    вышедшие, пока он был выше предела, никуда не разложены, а
+    подмешивать их при чтении pull_authors уже перестал.
+    """
+    posts = list(Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date'))
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    _bulk_insert(_entries(followers.iterator(), posts))
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту читателя постами автора после подписки."""
+    if not is_fanout_author(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')
+    _bulk_insert(_entries([user_id], posts.iterator()))
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты читателя посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id,
+        post__author_id=author_id
+    ).delete()
+
+
+def rebuild(author_ids=None):
+    """
+    Строит ленты подписок заново одним INSERT ... SELECT: все или,
+    если переданы author_ids, только записи постов этих авторов.
+    """
+    entries = TimelineEntry.objects.all()
+    condition, params = '', []
+    if author_ids is not None:
+        author_ids = list(author_ids)
+        if not author_ids:
+            return
+        entries = entries.filter(post__author_id__in=author_ids)
+        condition = 'AND post.author_id IN (%s) ' % ', '.join(
+            ['%s'] * len(author_ids)
+        )
+        params = author_ids
+    entries.delete()
+    tables = {
+        name: connection.ops.quote_name(model._meta.db_table)
+        for name, model in (
+            ('entry', TimelineEntry),
+            ('follow', Follow),
+            ('post', Post),
+            ('stats', UserStats),
+        )
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {entry} (user_id, post_id, pub_date) '
+            'SELECT follow.user_id, post.id, post.pub_date '
+            'FROM {follow} AS follow '
+            'JOIN {post} AS post ON post.author_id = follow.author_id '
+            'LEFT JOIN {stats} AS stats ON stats.user_id = follow.author_id '
+            'WHERE follow.user_id IS NOT NULL '
+            'AND COALESCE(stats.followers_count, 0) <= %s '
+            '{condition}'.format(condition=condition, **tables),
+            [settings.TIMELINE_FANOUT_LIMIT] + params
+        )
+
+
+def pull_authors(user):
+    """
+    Авторы с огромным числом подписчиков, на которых подписан читатель:
+    их посты не раскладываются по лентам и читаются напрямую.
+    """
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+        ).values_list('author_id', flat=True)
+    )
+
+
+def _feed(user, related=FEED_RELATED):
+    """
+    Выборка ленты подписок и признак, что это записи TimelineEntry,
+    а не сами посты. Посты авторов выше предела раскладки в ленту не
+    разложены и подмешиваются к ней при чтении.
+    """
+    authors = pull_authors(user)
+    if authors:
+        posts = Post.objects.select_related(*related).filter(
+            Q(pk__in=TimelineEntry.objects.filter(
+                user=user
+            ).values('post_id'))
+            | Q(author_id__in=authors)
+        )
+        return posts, False
+    entries = TimelineEntry.objects.filter(user=user).select_related(
+        'post', *['post__' + name for name in related]
+    )
+    return entries, True
+
+
+def get_feed_page(request, per_page=settings.NUMBER_TEN):
+    """Страница ленты подписок текущего пользователя."""
+    user = request.user
+    feed, entries = _feed(user)
+    # Лента меняется при подписке и отписке и с новыми постами.
+    scopes = [caching.follow_scope(user.pk), caching.POSTS_SCOPE]
+    page_obj = get_page(request, feed, per_page, scopes)
+    if entries:
+        page_obj.object_list = [
+            entry.post for entry in page_obj.object_list
+        ]
+    return page_obj
+
+
+def iter_feed(user, related=FEED_RELATED, chunk_size=None):
+    """
+    Все посты ленты подписок, новые первыми. Читаются из базы частями
+    по chunk_size, как и страница, — из материализованной ленты.
+    """
+    feed, entries = _feed(user, related)
+    rows = feed.order_by(*FEED_ORDERING).iterator(
+        chunk_size=chunk_size or settings.TIMELINE_BATCH_SIZE
+    )
+    if not entries:
+        yield from rows
+        return
+    for entry in rows:
+        yield entry.post
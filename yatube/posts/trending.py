@@ -0,0 +1,83 @@
+"""
+Популярные посты и группы.
+
+Популярность поста — сумма весов его комментариев за последние
+TRENDING_WINDOW секунд плюс вес аудитории автора (логарифм числа
+подписчиков). Все веса затухают вдвое каждые TRENDING_HALF_LIFE
+секунд: комментарий — от своей даты, аудитория — от даты поста.
+Популярность группы — сумма популярности её постов. Считается
+периодически (update_trending), а лучшие TRENDING_POSTS постов
+и TRENDING_GROUPS групп кладутся в таблицы с местом в рейтинге
+как первичным ключом.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching
+from .models import Comment, Post, TrendingGroup, TrendingPost
+
+
+def decay(age):
+    """Множитель веса для события возрастом age секунд."""
+    return 0.5 ** (max(age, 0) / settings.TRENDING_HALF_LIFE)
+
+
+def scores(now=None):
+    """Популярность постов и групп: ({post_id: score}, {group_id: score})."""
+    now = now or timezone.now()
+    since = now - timedelta(seconds=settings.TRENDING_WINDOW)
+    post_scores = defaultdict(float)
+    post_groups = {}
+    posts = Post.objects.filter(pub_date__gte=since).values_list(
+        'pk', 'group_id', 'pub_date', 'author__stats__followers_count'
+    )
+    for post_id, group_id, pub_date, followers in posts.iterator():
+        post_groups[post_id] = group_id
+        audience = math.log2(1 + (followers or 0))
+        post_scores[post_id] += (
+            settings.TRENDING_FOLLOWER_WEIGHT * audience
+            * decay((now - pub_date).total_seconds())
+        )
+    comments = Comment.objects.filter(pub_date__gte=since).values_list(
+        'post_id', 'post__group_id', 'pub_date'
+    )
+    for post_id, group_id, pub_date in comments.iterator():
+        post_groups[post_id] = group_id
+        post_scores[post_id] += decay((now - pub_date).total_seconds())
+    group_scores = defaultdict(float)
+    for post_id, score in post_scores.items():
+        if post_groups[post_id] is not None:
+            group_scores[post_groups[post_id]] += score
+    return post_scores, group_scores
+
+
+def _top(found, limit):
+    return sorted(
+        (item for item in found.items() if item[1] > 0),
+        key=lambda item: (-item[1], -item[0])
+    )[:limit]
+
+
+def rebuild(now=None):
+    """Пересчитывает рейтинги; возвращает число постов и групп в них."""
+    post_scores, group_scores = scores(now)
+    posts = _top(post_scores, settings.TRENDING_POSTS)
+    groups = _top(group_scores, settings.TRENDING_GROUPS)
+    with transaction.atomic():
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create(
+            TrendingPost(rank=rank, post_id=post_id, score=score)
+            for rank, (post_id, score) in enumerate(posts, 1)
+        )
+        TrendingGroup.objects.all().delete()
+        TrendingGroup.objects.bulk_create(
+            TrendingGroup(rank=rank, group_id=group_id, score=score)
+            for rank, (group_id, score) in enumerate(groups, 1)
+        )
+    caching.bump(caching.TRENDING_SCOPE)
+    return len(posts), len(groups)
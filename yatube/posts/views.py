@@ -1,80 +1,156 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 
+from core.ratelimit import ratelimit
+from core.routers import read_from_replica
+
+from . import caching, follows
 from .forms import PostForm, CommentForm
-from .models import Post, Group, User, Comment, Follow
+from .models import Post, Group, User, Follow, TrendingGroup, TrendingPost
+from .paginators import CursorPaginator, get_comments_page, get_page
+from .search import get_search_page
+from .timeline import get_feed_page
+
 
+def _followed_authors(request, posts):
+    """Авторы постов страницы, на которых подписан посетитель."""
+    return follows.followed_among(
+        request.user.pk,
+        [post.author_id for post in posts]
+    )
 
+
+@read_from_replica
+@caching.anonymous_page(caching.index_state)
 def index(request):
     request_of_posts = Post.objects.select_related('author', 'group').all()
-    paginator = Paginator(request_of_posts, settings.NUMBER_TEN)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = get_page(
+        request, request_of_posts, scopes=[caching.POSTS_SCOPE]
+    )
     template = 'posts/index.html'
     context = {
         'page_obj': page_obj,
+        'followed_authors': _followed_authors(request, page_obj),
     }
     return render(request, template, context)
 
 
+@read_from_replica
+@caching.anonymous_page(caching.popular_state)
+def popular(request):
+    # Рейтинг уже посчитан: страница — диапазон по первичному ключу.
+    paginator = CursorPaginator(
+        TrendingPost.objects.select_related('post__author', 'post__group'),
+        settings.NUMBER_TEN,
+        ordering=('rank',)
+    )
+    page_obj = paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    page_obj.object_list = [entry.post for entry in page_obj]
+    context = {
+        'page_obj': page_obj,
+        'groups': TrendingGroup.objects.select_related('group'),
+        'followed_authors': _followed_authors(request, page_obj),
+        'popular': True,
+    }
+    return render(request, 'posts/popular.html', context)
+
+
+@read_from_replica
+@caching.anonymous_page(caching.group_state)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     template = 'posts/group_list.html'
-    request_of_group = group.posts.all()
-    paginator = Paginator(request_of_group, settings.NUMBER_TEN)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    request_of_group = group.posts.select_related('author')
+    page_obj = get_page(
+        request, request_of_group, scopes=[caching.group_scope(group.pk)]
+    )
     context = {
         'group': group,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'followed_authors': _followed_authors(request, page_obj),
     }
     return render(request, template, context)
 
 
+@read_from_replica
+@caching.anonymous_page(caching.profile_state)
 def profile(request, username):
-    author = User.objects.get(username=username)
+    author = User.objects.select_related('stats').get(username=username)
     request_of_authors = author.posts.all()
-    paginator = Paginator(request_of_authors, settings.NUMBER_TEN)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    if (request.user.is_authenticated
-            and Follow.objects.filter(
-                author=author,
-                user=request.user
-            ).exists()):
-        following = True
-    else:
-        following = False
+    page_obj = get_page(
+        request,
+        request_of_authors,
+        scopes=[caching.profile_scope(author.pk)]
+    )
+    following = follows.is_following(request.user.pk, author.pk)
     context = {
         'page_obj': page_obj,
         'author': author,
-        'following': following
+        'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@caching.anonymous_page(caching.post_state)
 def post_detail(request, post_id):
     form = CommentForm()
-    post = get_object_or_404(Post, pk=post_id)
-    comments = Comment.objects.filter(post=post)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'),
+        pk=post_id
+    )
+    comments = get_comments_page(
+        request,
+        post.comments.select_related('author')
+    )
     context = {
         'post': post,
         'form': form,
         'comments': comments
-
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая пачка комментариев поста без остальной страницы."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = get_comments_page(
+        request,
+        post.comments.select_related('author')
+    )
+    context = {
+        'post': post,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_obj': get_search_page(request, query),
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@ratelimit('post_create')
 def post_create(request):
     form = PostForm(request.POST or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        # Транзакция SQLite сразу берёт блокировку записи (BEGIN
+        # IMMEDIATE): показ формы и ошибки проверки её не ждут.
+        with transaction.atomic():
+            post.save()
         return redirect('posts:profile', post.author)
     return render(
         request,
@@ -84,6 +160,7 @@ def post_create(request):
 
 
 @login_required
+@ratelimit('post_edit')
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
@@ -94,7 +171,8 @@ def post_edit(request, post_id):
         instance=post
     )
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            form.save()
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'post': post,
@@ -104,7 +182,16 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+def _wants_fragment(request):
+    """Запрос из скрипта страницы: ответить фрагментом, а не редиректом."""
+    return (
+        request.is_ajax()
+        or 'application/json' in request.META.get('HTTP_ACCEPT', '')
+    )
+
+
 @login_required
+@ratelimit('add_comment')
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -112,47 +199,67 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
-    return redirect('posts:post_detail', post_id=post_id)
+        with transaction.atomic():
+            comment.save()
+    if not _wants_fragment(request):
+        return redirect('posts:post_detail', post_id=post_id)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    # Счётчик сдвинул сигнал прямо в базе.
+    post.refresh_from_db(fields=['comments_count'])
+    return JsonResponse({
+        'html': render_to_string(
+            'posts/includes/comment.html',
+            {'comment': comment},
+            request
+        ),
+        'comments_count': post.comments_count,
+    }, status=201)
 
 
 @login_required
+@read_from_replica
 def follow_index(request):
     # информация о текущем пользователе доступна в переменной request.user
-    request_of_posts = Post.objects.filter(
-        author__following__user=request.user
-    )
-    paginator = Paginator(request_of_posts, settings.NUMBER_TEN)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = get_feed_page(request)
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@ratelimit('follow', methods=('GET', 'POST'))
+@transaction.atomic
 def profile_follow(request, username):
     # Подписаться на автора
     author = get_object_or_404(User, username=username)
-    subscription = Follow.objects.filter(user=request.user, author=author)
-    if author == request.user or subscription.exists():
-        return redirect('posts:profile', username=username)
-    Follow.objects.create(
-        user=request.user,
-        author=author
-    )
+    if (author != request.user
+            and not follows.is_following(request.user.pk, author.pk)):
+        try:
+            # Точка сохранения: если кэш отстал и подписка уже есть,
+            # откатится только эта вставка.
+            with transaction.atomic():
+                Follow.objects.create(user=request.user, author=author)
+        except IntegrityError:
+            # Подписка есть, а кэш о ней не знал: его правили
+            # параллельные запросы. Запись строится заново.
+            follows.forget(request.user.pk)
     return redirect('posts:profile', username=username)
 
 
 @login_required
+@ratelimit('follow', methods=('GET', 'POST'))
+@transaction.atomic
 def profile_unfollow(request, username):
     # Дизлайк, отписка
     author = get_object_or_404(User, username=username)
-    record = Follow.objects.filter(
-        user=request.user,
-        author=author
-    )
-    if record.exists():
-        record.delete()
+    # delete() сам выбирает записи, чтобы разослать сигналы: отдельная
+    # проверка exists() не нужна.
+    deleted, _ = Follow.objects.filter(
+        user=request.user, author=author
+    ).delete()
+    if not deleted:
+        # Подписки нет, а кэш, видимо, считал иначе.
+        follows.forget(request.user.pk)
     return redirect('posts:profile', username=username)
@@ -44,10 +44,13 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail'
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,12 +84,31 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# core.backends.sqlite3 включает WAL и прочие PRAGMA, повторяет запросы
+# к занятой базе и периодически переносит WAL в файл базы.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'OPTIONS': {
+            'timeout': 5,
+            'busy_retries': 5,
+            'checkpoint_interval': 300,
+        },
+    },
+    # Копия основной базы, из которой читаются ленты; её обновляет
+    # manage.py refresh_replica --interval REPLICA_REFRESH_INTERVAL.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+    },
 }
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+REPLICA_REFRESH_INTERVAL = 5
+# Реплика старше этого не используется: refresh_replica, видимо, стоит.
+REPLICA_MAX_LAG = 60
+# Столько после записи посетитель читает из основной базы.
+REPLICA_STICKY_SECONDS = 2 * REPLICA_REFRESH_INTERVAL
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -120,10 +142,78 @@ USE_L10N = True
 USE_TZ = True
 
 NUMBER_TEN = 10
+# Ссылки ?page=N: сколько страниц показывать вокруг текущей
+# и с краёв; с какого размера всей таблицы вместо COUNT(*) брать
+# оценку из статистики SQLite (sqlite_stat1).
+PAGINATOR_ON_EACH_SIDE = 2
+PAGINATOR_ON_ENDS = 1
+PAGINATOR_ESTIMATE_THRESHOLD = 100000
+
+# Комментариев на странице поста и в одной подгружаемой пачке.
+COMMENTS_PER_PAGE = 50
+
+# Авторы, у которых подписчиков больше этого числа, не раскладывают
+# новые посты по лентам подписчиков: их посты подмешиваются при чтении.
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BATCH_SIZE = 1000
+
+# Фрагменты лент сбрасываются сигналами при изменении данных,
+# поэтому могут жить долго.
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Граф подписок в кэше тоже обновляется сигналами; срок жизни только
+# ограничивает расхождение, если два запроса правят одну запись.
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 * 24
+
+# Популярное (posts.trending, update_trending): за какой период
+# учитываются комментарии и посты, за сколько секунд их вес падает
+# вдвое, вес аудитории автора и сколько постов и групп в рейтингах.
+TRENDING_WINDOW = 60 * 60 * 24 * 7
+TRENDING_HALF_LIFE = 60 * 60 * 12
+TRENDING_FOLLOWER_WEIGHT = 1.0
+TRENDING_POSTS = 100
+TRENDING_GROUPS = 20
+
+# Пределы частоты запросов на запись (core.ratelimit): сколько
+# запросов подряд и за какой период ведро пополняется целиком.
+RATELIMIT_ENABLED = True
+# Сколько своих обратных прокси (nginx, балансировщик) стоит перед
+# приложением. 0 — запросы приходят напрямую, ведро по REMOTE_ADDR.
+# Иначе адрес посетителя берётся из X-Forwarded-For, столько адресов
+# справа: каждый прокси дописывает туда адрес, с которого к нему пришли.
+# Больше настоящего числа ставить нельзя — посетитель подставит в
+# заголовок любой адрес и получит новое ведро.
+RATELIMIT_TRUSTED_PROXIES = 0
+RATELIMITS = {
+    'post_create': '10/h',
+    'post_edit': '30/h',
+    'add_comment': '10/m',
+    'follow': '30/m',
+    'signup': '5/h',
+}
+
+# JSON API: наибольший размер страницы (?limit=) и число постов,
+# которые потоковый ответ (?stream) читает из базы за раз.
+API_MAX_PAGE_SIZE = 100
+API_CHUNK_SIZE = 500
+
+# Заголовок Server-Timing: доля запросов, которые замеряются, и запись
+# каждого замера строкой JSON в журнал core.middleware.
+SERVER_TIMING_SAMPLE_RATE = 1.0 if DEBUG else 0.05
+SERVER_TIMING_LOG = False
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Варианты картинок постов разной ширины, в WebP и в исходном формате:
+# строятся в фоне сразу после публикации. Высота варианта не больше
+# доли его ширины, как у прежней миниатюры 960x339.
+POST_IMAGE_WIDTHS = (320, 640, 960, 1920)
+POST_IMAGE_HEIGHT_RATIO = 339 / 960
+# Потоки читают и сохраняют файлы, процессы перекодируют картинки.
+THUMBNAIL_WORKERS = 2
+IMAGE_PROCESSES = 2
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
@@ -138,10 +228,27 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Общий для всех процессов кэш в файле SQLite.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 10,
+        },
     }
 }
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.middleware': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
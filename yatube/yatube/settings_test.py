@@ -0,0 +1,23 @@
+"""
+Настройки для тестов: manage.py test и pytest.
+
+Реплики нет — все чтения идут в тестовую базу; кэш в памяти процесса,
+чтобы прогоны не видели записей друг друга; картинки строятся сразу,
+а пределы частоты запросов выключены.
+"""
+from .settings import *  # noqa: F401, F403
+from .settings import CACHES, DATABASES
+
+DATABASES = {'default': DATABASES['default']}
+
+CACHES = {
+    'default': {
+        **CACHES['default'],
+        'LOCATION': 'file:yatube-test-cache?mode=memory&cache=shared',
+    }
+}
+
+RATELIMIT_ENABLED = False
+
+THUMBNAIL_WORKERS = 0
+IMAGE_PROCESSES = 0
@@ -6,6 +6,7 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
     path('about/', include('about.urls', namespace='about')),
+    path('api/v1/', include('api.urls', namespace='api')),
     path('', include('posts.urls', namespace='posts')),
     path('admin/', admin.site.urls),
     path('auth/', include('django.contrib.auth.urls'))